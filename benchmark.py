@@ -0,0 +1,822 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from catalog import DescriptionParser, load_product_lines
+from compact import bytes_per_row, compact_invoices
+from data_loader import clean_invoices
+from filter_index import FilterIndex, sort_by_date
+from metrics import METRICS, metrics_over_time
+from migrate_data import connect_for_bulk_load, insert_rows, prepare_rows, process_data
+from normalize import extract_weight, excel_date_to_datetime, extract_weights, excel_dates_to_datetime
+from pipeline import derive_lines, derive_rollup, filter_mask
+from rollups import ROLLUP_KEYS, add_profit, build_daily_rollup, finish_summary, period_key, refresh_sqlite_rollup, summarize
+from search import SEARCH_COLUMNS, SearchIndex
+from render_budget import CHART_WEBGL_POINTS, downsample, figure_payload_bytes, top_series
+from setup_database import create_database
+import stub_supabase
+from synthetic import PRODUCT_FORMS, make_invoice_table, make_quickbooks_export, write_quickbooks_csv
+
+
+def make_raw_columns(rows, seed=42):
+    """
+    Build weight, total_weight and date columns shaped like the Supabase invoices table.
+    """
+    rng = np.random.default_rng(seed)
+    unit_weights = rng.choice([25, 50, 500, 1000, 2000], rows)
+    quantities = rng.integers(1, 40, rows)
+
+    # Mostly Excel serials stored as text, with some ISO strings and gaps mixed in
+    serials = (43000 + rng.integers(0, 2000, rows)).astype(str).astype(object)
+    iso = pd.to_datetime(43000 + rng.integers(0, 2000, rows), unit='D', origin='1899-12-30')
+    dates = np.where(rng.random(rows) < 0.2, iso.strftime('%Y-%m-%d').to_numpy(dtype=object), serials)
+    dates[rng.random(rows) < 0.01] = None
+
+    weights = pd.Series(unit_weights).astype(str) + ' lbs'
+    total_weights = pd.Series(unit_weights * quantities).astype(str) + ' lbs'
+    total_weights[rng.random(rows) < 0.01] = None
+    return pd.DataFrame({
+        'weight': weights.astype(object),
+        'total_weight': total_weights.astype(object),
+        'date': pd.Series(dates, dtype=object),
+    })
+
+
+def time_call(func, repeat=1):
+    """
+    Return the best wall-clock time of `repeat` calls and the last result.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def normalize_rowwise(raw):
+    return (
+        raw['weight'].apply(extract_weight),
+        raw['total_weight'].apply(extract_weight),
+        raw['date'].apply(excel_date_to_datetime),
+    )
+
+
+def normalize_vectorized(raw):
+    return (
+        extract_weights(raw['weight']),
+        extract_weights(raw['total_weight']),
+        excel_dates_to_datetime(raw['date']),
+    )
+
+
+def bench_normalize(rows, repeat=1):
+    """
+    Time the row-by-row helpers against the vectorized normalization stage.
+    """
+    raw = make_raw_columns(rows)
+    rowwise_time, expected = time_call(lambda: normalize_rowwise(raw), repeat)
+    vectorized_time, actual = time_call(lambda: normalize_vectorized(raw), repeat)
+
+    # The fast path must reproduce the row-by-row output exactly
+    for old, new in zip(expected, actual):
+        old = pd.to_datetime(old) if new.dtype.kind == 'M' else old.astype('float64')
+        if not old.equals(new):
+            raise AssertionError("Vectorized normalization does not match the row-by-row helpers")
+
+    return {
+        'rows': rows,
+        'rowwise_s': round(rowwise_time, 4),
+        'vectorized_s': round(vectorized_time, 4),
+        'speedup': round(rowwise_time / vectorized_time, 1) if vectorized_time else None,
+    }
+
+
+def make_invoice_lines(rows, seed=42, customers=200, days=1500):
+    """
+    Build cleaned invoice lines with the profit columns the dashboard adds.
+    """
+    rng = np.random.default_rng(seed)
+    amount = -rng.integers(50, 5000, rows).astype('float64')
+    amount[rng.random(rows) < 0.01] = 0.0
+    total_weight = rng.choice([25, 50, 500, 1000, 2000], rows) * rng.integers(1, 40, rows).astype('float64')
+    cost_per_lb = np.where(rng.random(rows) < 0.1, np.nan, 0.37)
+    profit = pd.Series(-amount - total_weight * cost_per_lb)
+    lines = pd.DataFrame({
+        'date': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, days, rows), unit='D'),
+        'customer_name': pd.Series(rng.integers(0, customers, rows)).map('Customer {}'.format),
+        'amount': amount,
+        'total_weight_value': total_weight,
+        'profit': profit,
+        'margin': profit / -pd.Series(amount) * 100,
+    })
+    lines['id'] = np.arange(1, rows + 1)
+    lines['material'] = rng.choice(np.array(['EpiX', 'KinetiX', 'DynamiX', None], dtype=object), rows)
+    lines['material_form'] = rng.choice(np.array(['Powder', 'Granule', 'Pellet'], dtype=object), rows)
+    return lines
+
+
+def metrics_loop(df, agg_level, names):
+    """
+    The previous per-period loop: one boolean mask and one call per period and metric.
+    """
+    funcs = {
+        'Total Revenue': lambda df: -df['amount'].sum(),
+        'Average Order Value': lambda df: -df['amount'].mean(),
+        'Profit per Order': lambda df: df['profit'].mean(),
+        'Orders per Customer': lambda df: df.groupby('customer_name').size().mean(),
+        'Average Margin': lambda df: df['margin'].mean(),
+        'Total Weight per Order': lambda df: df['total_weight_value'].mean()
+    }
+    metrics_df = df.copy()
+    metrics_df['period'] = period_key(metrics_df['date'], agg_level)
+    rows = []
+    for period in sorted(metrics_df['period'].unique()):
+        period_data = metrics_df[metrics_df['period'] == period]
+        period_metrics = {'period': period}
+        for name in names:
+            period_metrics[name] = funcs[name](period_data)
+        rows.append(period_metrics)
+    return pd.DataFrame(rows)
+
+
+def bench_metrics(rows, agg_level='Daily', repeat=1):
+    """
+    Time the per-period metrics loop against the single grouped pass.
+    """
+    lines = make_invoice_lines(rows)
+    names = list(METRICS)
+    loop_time, expected = time_call(lambda: metrics_loop(lines, agg_level, names), repeat)
+    grouped_time, actual = time_call(
+        lambda: metrics_over_time(lines, period_key(lines['date'], agg_level), names), repeat
+    )
+
+    if list(expected['period']) != list(actual['period']) or not np.allclose(
+            expected[names].to_numpy(float), actual[names].to_numpy(float), equal_nan=True):
+        raise AssertionError("Grouped metrics do not match the per-period loop")
+
+    return {
+        'rows': rows,
+        'periods': len(actual),
+        'loop_s': round(loop_time, 4),
+        'grouped_s': round(grouped_time, 4),
+        'speedup': round(loop_time / grouped_time, 1) if grouped_time else None,
+    }
+
+
+def pandas_rollup(lines, start, end, material=None, customer=None):
+    """
+    The in-memory path: copy, mask and group the invoice lines.
+    """
+    filtered = lines.copy()
+    filtered = filtered[(filtered['date'].dt.date >= start) & (filtered['date'].dt.date <= end)]
+    if material is not None:
+        filtered = filtered[filtered['material'] == material]
+    if customer is not None:
+        filtered = filtered[filtered['customer_name'] == customer]
+    return build_daily_rollup(filtered)
+
+
+def bench_columnar(rows, repeat=1):
+    """
+    Time the pandas rollup of a filtered view against the same query on the DuckDB store.
+    """
+    from columnar import build_store
+    from queries import DuckDBQuery, make_filters
+
+    lines = make_invoice_lines(rows).drop(columns=['profit', 'margin'])
+    start, end = datetime.date(2021, 1, 1), datetime.date(2021, 12, 31)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.duckdb')
+        build_time, _ = time_call(lambda: build_store([lines], path))
+        backend = DuckDBQuery(path)
+        backend.rollup(make_filters())  # open the store outside the timings
+
+        for label, material, customer in (
+            ('one year', None, None),
+            ('one year, EpiX', 'EpiX', None),
+            ('one year, one customer', None, 'Customer 7'),
+        ):
+            filters = make_filters([start, end], material, customer)
+            pandas_time, expected = time_call(lambda: pandas_rollup(lines, start, end, material, customer), repeat)
+            duckdb_time, actual = time_call(lambda: backend.rollup(filters, 'day'), repeat)
+
+            expected = expected.sort_values(ROLLUP_KEYS).reset_index(drop=True)
+            actual = actual.sort_values(ROLLUP_KEYS).reset_index(drop=True)
+            if len(expected) != len(actual) or not np.allclose(
+                    expected[['total_weight', 'amount', 'line_count']].to_numpy(float),
+                    actual[['total_weight', 'amount', 'line_count']].to_numpy(float)):
+                raise AssertionError("DuckDB rollup does not match the pandas rollup")
+
+            results.append({
+                'rows': rows,
+                'query': label,
+                'build_s': round(build_time, 4),
+                'pandas_s': round(pandas_time, 4),
+                'duckdb_s': round(duckdb_time, 4),
+                'speedup': round(pandas_time / duckdb_time, 1) if duckdb_time else None,
+            })
+    return results
+
+
+def rerun_with_copies(df, rollup, date_range, material, costs, agg_level):
+    """
+    The previous rerun: copy, chained masks, profit columns set on the copy
+    and a period column assigned to a fresh copy for every chart.
+    """
+    filtered_df = df.copy()
+    filtered_df = filtered_df[(filtered_df['date'].dt.date >= date_range[0]) &
+                              (filtered_df['date'].dt.date <= date_range[1])]
+    filtered_df = filtered_df[filtered_df['material'] == material]
+    filtered_df['cost_per_lb'] = filtered_df['material_form'].map(costs)
+    filtered_df['total_cost'] = filtered_df['total_weight_value'] * filtered_df['cost_per_lb']
+    filtered_df['profit'] = -filtered_df['amount'] - filtered_df['total_cost']
+    filtered_df['margin'] = (filtered_df['profit'] / -filtered_df['amount']) * 100
+    metrics_df = filtered_df.copy()
+    metrics_df['period'] = period_key(metrics_df['date'], agg_level)
+
+    filtered_rollup = rollup[(rollup['day'] >= pd.Timestamp(date_range[0])) &
+                             (rollup['day'] <= pd.Timestamp(date_range[1]))]
+    filtered_rollup = filtered_rollup[filtered_rollup['material'] == material]
+    profit_rollup = add_profit(filtered_rollup, costs)
+    charts = [
+        summarize(filtered_rollup.assign(period=period_key(filtered_rollup['day'], agg_level)), 'period'),
+        summarize(profit_rollup.assign(period=period_key(profit_rollup['day'], agg_level)), 'period'),
+        summarize(filtered_rollup.assign(period=period_key(filtered_rollup['day'], agg_level)),
+                  ['period', 'customer_name']),
+        summarize(filtered_rollup.assign(month=period_key(filtered_rollup['day'], "Monthly")),
+                  ['month', 'customer_name', 'material_form']),
+    ]
+    return metrics_df, charts
+
+
+def rerun_with_views(df, rollup, date_range, material, costs, agg_level):
+    """
+    The filter/derive pipeline: one mask per frame, one gather, shared derived frames.
+    """
+    lines = derive_lines(df, filter_mask(df, 'date', date_range, material), costs, agg_level)
+    filtered_rollup = derive_rollup(rollup, filter_mask(rollup, 'day', date_range, material), costs, agg_level)
+    charts = [
+        summarize(filtered_rollup, 'period'),
+        summarize(filtered_rollup, 'period'),
+        summarize(filtered_rollup, ['period', 'customer_name']),
+        summarize(filtered_rollup, ['month', 'customer_name', 'material_form']),
+    ]
+    return lines, charts
+
+
+def peak_memory(func):
+    """
+    Return the peak Python heap growth (MB) during one call.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def bench_pipeline(rows):
+    """
+    Peak memory and time of one filtered rerun with copies against the view pipeline.
+    """
+    df = make_invoice_lines(rows).drop(columns=['profit', 'margin'])
+    rollup = build_daily_rollup(df)
+    args = ([datetime.date(2020, 6, 1), datetime.date(2023, 6, 1)], 'EpiX', {'Powder': 0.37, 'Granule': 0.42}, 'Weekly')
+
+    copies_peak = peak_memory(lambda: rerun_with_copies(df, rollup, *args))
+    views_peak = peak_memory(lambda: rerun_with_views(df, rollup, *args))
+    copies_time, _ = time_call(lambda: rerun_with_copies(df, rollup, *args))
+    views_time, _ = time_call(lambda: rerun_with_views(df, rollup, *args))
+    return {
+        'rows': rows,
+        'frame_mb': round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1),
+        'copies_peak_mb': round(copies_peak, 1),
+        'views_peak_mb': round(views_peak, 1),
+        'copies_s': round(copies_time, 4),
+        'views_s': round(views_time, 4),
+    }
+
+
+def make_searchable_lines(rows, seed=42):
+    """
+    Invoice lines with the text fields of the Raw Data search (about three lines per document).
+    """
+    rng = np.random.default_rng(seed)
+    lines = make_invoice_lines(rows, seed)
+    products = np.array([f'{material} {form} {size} lb bag'
+                         for material in ('EpiX', 'KinetiX', 'DynamiX')
+                         for form in ('Powder', 'Granule', 'Pellet')
+                         for size in (25, 50, 500, 1000, 2000)], dtype=object)
+    lines['item_description'] = rng.choice(products, rows)
+    lines['memo'] = pd.Series(rng.integers(0, 500, rows)).map('PO {} - net 30'.format)
+    lines['document_number'] = pd.Series(np.arange(rows) // 3 + 1000).map('INV-{}'.format)
+    return lines
+
+
+def substring_scan(lines, term):
+    """
+    The previous search: a case-insensitive substring scan of every column's text.
+    """
+    return pd.DataFrame([lines[col].astype(str).str.contains(term, case=False, na=False)
+                         for col in SEARCH_COLUMNS]).any().to_numpy()
+
+
+def bench_search(rows, queries=('customer 17', 'inv-100', 'epix pellet po 12')):
+    """
+    Substring scan per query against building the search index once and looking queries up.
+    """
+    lines = make_searchable_lines(rows)
+    build_time, index = time_call(lambda: SearchIndex(lines))
+
+    # A single word found by the index is also a substring match of the scan
+    scan_time, scanned = time_call(lambda: substring_scan(lines, 'customer'))
+    found = index.search('customer')
+    assert not (found & ~scanned).any(), "Index matched lines the substring scan does not"
+
+    results = []
+    for query in queries:
+        lookup_time, mask = time_call(lambda: index.search(query), 5)
+        results.append({
+            'rows': rows,
+            'query': query,
+            'matches': int(mask.sum()),
+            'scan_s': round(scan_time, 4),
+            'index_build_s': round(build_time, 4),
+            'lookup_ms': round(lookup_time * 1000, 2),
+        })
+    return results
+
+
+def weight_client_figure(points, render_mode='auto'):
+    import plotly.express as px
+
+    return px.line(points, x='period', y='total_weight_value', color='customer_name', render_mode=render_mode)
+
+
+def bench_render(rows):
+    """
+    Payload and build time of the Daily weight-by-client chart with and without the render budget.
+    """
+    lines = make_invoice_lines(rows).drop(columns=['profit', 'margin'])
+    rollup = build_daily_rollup(lines)
+    rollup['period'] = period_key(rollup['day'], 'Daily')
+    points = summarize(rollup, ['period', 'customer_name'])[['period', 'customer_name', 'total_weight']]
+    points = points.rename(columns={'total_weight': 'total_weight_value'})
+
+    full_time, full_fig = time_call(lambda: weight_client_figure(points))
+    shown_time, shown = time_call(lambda: downsample(
+        top_series(points, 'customer_name', 'total_weight_value', ['period']),
+        'period', 'total_weight_value', 'customer_name'
+    ))
+    figure_time, budget_fig = time_call(lambda: weight_client_figure(
+        shown, 'webgl' if len(shown) > CHART_WEBGL_POINTS else 'auto'
+    ))
+    return {
+        'rows': rows,
+        'points': len(points),
+        'full_kb': round(figure_payload_bytes(full_fig) / 1024),
+        'full_s': round(full_time, 3),
+        'budget_points': len(shown),
+        'budget_kb': round(figure_payload_bytes(budget_fig) / 1024),
+        'budget_s': round(shown_time + figure_time, 3),
+    }
+
+
+def make_cleaned_invoices(rows, seed=42):
+    """
+    Invoice lines with every text column of the cleaned invoices frame, weight text included.
+    """
+    rng = np.random.default_rng(seed)
+    lines = make_searchable_lines(rows, seed).drop(columns=['profit', 'margin'])
+    lines['type'] = rng.choice(np.array(['Invoice', 'Credit Memo'], dtype=object), rows, p=[0.95, 0.05])
+    lines['account'] = rng.choice(np.array(['Sales', 'Sales:Samples', 'Shipping'], dtype=object), rows)
+    lines['total_weight'] = lines['total_weight_value'].map('{:.0f} lbs'.format)
+    lines['weight_value'] = rng.choice([25.0, 50.0, 500.0, 1000.0, 2000.0], rows)
+    lines['weight'] = lines['weight_value'].map('{:.0f} lbs'.format)
+    return lines
+
+
+def bench_compact(rows, repeat=1):
+    """
+    Bytes per row and rollup/filter time of the cleaned frame before and after compaction.
+    """
+    df = make_cleaned_invoices(rows)
+    compact_time, compact = time_call(lambda: compact_invoices(df))
+    date_range = [datetime.date(2020, 6, 1), datetime.date(2023, 6, 1)]
+    results = {'rows': rows, 'compact_s': round(compact_time, 3)}
+    for label, frame in (('object', df), ('compact', compact)):
+        rollup_time, _ = time_call(lambda: build_daily_rollup(frame), repeat)
+        filter_time, _ = time_call(lambda: filter_mask(frame, 'date', date_range, 'EpiX', 'Customer 17'), repeat)
+        results[f'{label}_bytes_per_row'] = bytes_per_row(frame)
+        results[f'{label}_rollup_s'] = round(rollup_time, 4)
+        results[f'{label}_filter_s'] = round(filter_time, 4)
+    return results
+
+
+def bench_filter(rows, repeat=1):
+    """
+    Full-scan filter mask against the sorted date and value position indexes, for filters of different reach.
+    """
+    df = sort_by_date(compact_invoices(make_cleaned_invoices(rows)))
+    build_time, index = time_call(lambda: FilterIndex(df, 'date'))
+    filters = [
+        ('all dates', [datetime.date(2019, 1, 1), datetime.date(2025, 1, 1)], 'All', 'All'),
+        ('one quarter', [datetime.date(2022, 1, 1), datetime.date(2022, 3, 31)], 'All', 'All'),
+        ('material', [datetime.date(2020, 6, 1), datetime.date(2023, 6, 1)], 'EpiX', 'All'),
+        ('customer, one quarter', [datetime.date(2022, 1, 1), datetime.date(2022, 3, 31)], 'All', 'Customer 17'),
+    ]
+    results = []
+    for name, date_range, material, customer in filters:
+        scan_time, mask = time_call(lambda: np.flatnonzero(filter_mask(df, 'date', date_range, material, customer)), repeat)
+        index_time, positions = time_call(
+            lambda: index.positions(date_range, material=material, customer_name=customer), repeat
+        )
+        assert np.array_equal(mask, positions), "Index and scan disagree"
+        results.append({
+            'rows': rows,
+            'filter': name,
+            'matches': len(positions),
+            'index_build_s': round(build_time, 3),
+            'scan_ms': round(scan_time * 1000, 2),
+            'index_ms': round(index_time * 1000, 2),
+        })
+    return results
+
+
+def bench_ingest(rows, seed=42, repeat=1):
+    """
+    Time the migrate_data.py load of a synthetic export: process_data(), the
+    row preparation, the bulk insert and the daily rollup refresh.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'export.csv')
+        db_path = os.path.join(tmp, 'invoices.db')
+        generate_time, _ = time_call(lambda: write_quickbooks_csv(csv_path, rows, seed))
+        # A fresh parser each time: nothing carried over from earlier runs or files
+        parse_time, processed = time_call(lambda: process_data(csv_path, DescriptionParser()), repeat)
+        prepare_time, prepared = time_call(lambda: prepare_rows(processed), repeat)
+
+        # Inserted once: a second insert would load the rows twice
+        create_database(db_path)
+        conn = connect_for_bulk_load(db_path)
+        try:
+            insert_time, _ = time_call(lambda: insert_rows(conn, prepared))
+            days = processed['invoice_date'].dropna().unique()
+            rollup_time, _ = time_call(lambda: refresh_sqlite_rollup(conn, days))
+        finally:
+            conn.close()
+        load_time = parse_time + prepare_time + insert_time + rollup_time
+        return {
+            'rows': rows,
+            'csv_mb': round(os.path.getsize(csv_path) / 1024 / 1024, 1),
+            'generate_s': round(generate_time, 3),
+            'process_data_s': round(parse_time, 3),
+            'prepare_s': round(prepare_time, 3),
+            'insert_s': round(insert_time, 3),
+            'rollup_s': round(rollup_time, 3),
+            'rows_per_s': round(rows / load_time),
+        }
+
+
+def bench_descriptions(rows, seed=42, repeat=1):
+    """
+    Item description parsing: the catalog pattern over every row against the
+    parser, on a first run and on a rerun with its cache filled.
+    """
+    descriptions = make_quickbooks_export(rows, seed)['Item: Description (Sales) ']
+    pattern = DescriptionParser().pattern
+    rowwise_time, expected = time_call(lambda: descriptions.str.extract(pattern), repeat)
+    cold_time, parsed = time_call(lambda: DescriptionParser().parse_column(descriptions), repeat)
+    warm_parser = DescriptionParser()
+    warm_parser.parse_column(descriptions)
+    warm_time, _ = time_call(lambda: warm_parser.parse_column(descriptions), repeat)
+    assert expected[0].fillna('').equals(parsed['material'].fillna('')), "Parser and pattern disagree"
+    return {
+        'rows': rows,
+        'distinct': descriptions.nunique(),
+        'product_lines': len(load_product_lines()),
+        'every_row_s': round(rowwise_time, 3),
+        'parser_s': round(cold_time, 3),
+        'cached_s': round(warm_time, 3),
+        'speedup': round(rowwise_time / cold_time, 1),
+    }
+
+
+def bench_dashboard(rows, seed=42, repeat=1, agg_level='Weekly'):
+    """
+    Time each step of a dashboard rerun on a synthetic invoices table, in
+    app.py order: normalization, filtering and every chart aggregation.
+    """
+    table = make_invoice_table(rows, seed)
+    material_costs = {form: 0.37 for form in PRODUCT_FORMS}
+    date_range = [datetime.date(2023, 1, 1), datetime.date(2023, 12, 31)]
+    results = []
+
+    def step(name, func):
+        seconds, value = time_call(func, repeat)
+        results.append({
+            'rows': rows,
+            'step': name,
+            'output_rows': len(value) if hasattr(value, '__len__') else None,
+            'ms': round(seconds * 1000, 2),
+        })
+        return value
+
+    # Load: data_loader.load_invoices / load_rollup / load_filter_indexes
+    cleaned = step('clean', lambda: clean_invoices(table))
+    compacted = step('compact', lambda: compact_invoices(cleaned))
+    df = step('sort', lambda: sort_by_date(compacted))
+    rollup = step('rollup', lambda: sort_by_date(build_daily_rollup(df), 'day'))
+    lines_index = step('filter_index', lambda: FilterIndex(df, 'date'))
+    rollup_index = step('rollup_filter_index', lambda: FilterIndex(rollup, 'day'))
+
+    # Sidebar filters and the two frames every chart reads
+    line_positions = step('filter', lambda: lines_index.positions(date_range, material='EpiX', customer_name='All'))
+    rollup_positions = step('rollup_filter', lambda: rollup_index.positions(date_range, material='EpiX',
+                                                                             customer_name='All'))
+    lines = step('derive_lines', lambda: derive_lines(df, line_positions, material_costs, agg_level))
+    filtered_rollup = step('derive_rollup', lambda: derive_rollup(rollup, rollup_positions, material_costs, agg_level))
+
+    # Chart aggregations
+    step('totals', lambda: finish_summary(filtered_rollup.sum(numeric_only=True).to_frame().T))
+    step('time_series', lambda: summarize(filtered_rollup[filtered_rollup['day'].notna()], 'period'))
+    step('by_material', lambda: summarize(filtered_rollup, 'material'))
+    step('by_material_form', lambda: summarize(filtered_rollup, ['material', 'material_form']))
+    step('by_period', lambda: summarize(filtered_rollup, 'period'))
+    step('by_customer', lambda: summarize(filtered_rollup, 'customer_name'))
+    step('profit_heatmap', lambda: filtered_rollup.pivot_table(
+        values='profit', index='customer_name', columns='material', aggfunc='sum', fill_value=0, observed=True
+    ).head(10))
+    weight_client = step('by_period_customer', lambda: summarize(filtered_rollup, ['period', 'customer_name'])[
+        ['period', 'customer_name', 'total_weight']
+    ].rename(columns={'total_weight': 'total_weight_value'}))
+    step('weight_client_budget', lambda: downsample(
+        top_series(weight_client, 'customer_name', 'total_weight_value', ['period']),
+        'period', 'total_weight_value', 'customer_name'
+    ))
+    step('metrics', lambda: metrics_over_time(lines, lines['period'], list(METRICS)))
+    monthly_orders = step('by_month_customer_form', lambda: summarize(
+        filtered_rollup, ['month', 'customer_name', 'material_form']
+    )[['month', 'customer_name', 'material_form', 'line_count']].rename(columns={'line_count': 'order_count'}))
+    step('monthly_orders_budget', lambda: top_series(
+        monthly_orders, 'customer_name', 'order_count', ['month', 'material_form']
+    ))
+
+    # The same rerun through app.py, every view drawn, so a break there shows up here too. The
+    # sidebar filters pick the busiest material and customer pair that misses some product forms
+    # (their categories stay in the cached frames), then a segment is picked
+    pairs = table.dropna(subset=['material']).groupby(['material', 'customer_name'])['material_form'].agg(
+        ['nunique', 'size'])
+    partial = pairs[pairs['nunique'] < table['material_form'].nunique()]
+    material, customer = (partial if len(partial) else pairs)['size'].idxmax()
+    filters = {'Select Material Type': material, 'Select Customer': customer}
+    for step_name, rerun in (('memory_mode_rerun', memory_mode_rerun), ('query_mode_rerun', query_mode_rerun)):
+        seconds, charts = rerun(table, filters)
+        results.append({'rows': rows, 'step': step_name, 'output_rows': charts, 'ms': round(seconds * 1000, 2)})
+    return results
+
+
+# Runs app.py once in a fresh interpreter (the query mode is read at import),
+# then again for each sidebar filter in the JSON of argv[1] and for a segment,
+# and prints the charts drawn and any errors as JSON
+_APP_RERUN_SCRIPT = '''
+import json
+import sys
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file('app.py', default_timeout=600)
+app.session_state['authenticated'] = True
+app.run()
+errors = []
+def check():
+    errors.extend(error.message for error in app.exception)
+    errors.extend(error.value for error in app.error)
+    return not errors
+if check():
+    for label, value in json.loads(sys.argv[1]).items():
+        [box for box in app.sidebar.selectbox if box.label == label][0].select(value).run()
+        if not check():
+            break
+    segments = [box for box in app.selectbox if box.key == 'segment_selector']
+    if not errors and segments and len(segments[0].options) > 1:
+        segments[0].select(segments[0].options[-1]).run()
+        check()
+print(json.dumps({'charts': len(app.get('plotly_chart')), 'errors': errors}))
+'''
+
+
+def app_rerun(env, filters):
+    """
+    Run app.py with `env` and every view drawn, picking the sidebar
+    `filters` ({label: value}) and then a segment. Returns (seconds, charts
+    drawn by the last rerun); raises if a rerun failed.
+    """
+    env = dict(os.environ, INVOICE_LAZY_TABS='0', INVOICE_TIMING_LOG='0', **env)
+    started = time.perf_counter()
+    run = subprocess.run([sys.executable, '-c', _APP_RERUN_SCRIPT, json.dumps(filters, default=str)], env=env,
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds = time.perf_counter() - started
+    mode = env.get('INVOICE_QUERY_MODE', 'memory')
+    if run.returncode != 0:
+        raise RuntimeError(f"Dashboard rerun ({mode} mode) crashed:\n{run.stderr[-2000:]}")
+    outcome = json.loads(run.stdout.strip().splitlines()[-1])
+    if outcome['errors']:
+        raise RuntimeError(f"Dashboard rerun ({mode} mode) failed: {outcome['errors']}")
+    return seconds, outcome['charts']
+
+
+def query_mode_rerun(table, filters, mode='sqlite'):
+    """
+    Load `table` into a scratch invoices.db and run the dashboard (see
+    app_rerun) in INVOICE_QUERY_MODE=`mode` against it.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'invoices.db')
+        create_database(db_path)
+        conn = connect_for_bulk_load(db_path)
+        try:
+            insert_rows(conn, table)
+            refresh_sqlite_rollup(conn, table['invoice_date'].dropna().unique())
+        finally:
+            conn.close()
+        return app_rerun({'INVOICE_QUERY_MODE': mode, 'INVOICE_QUERY_SQLITE_PATH': db_path}, filters)
+
+
+def memory_mode_rerun(table, filters):
+    """
+    Serve `table` from a local stub of the Supabase REST API (see
+    stub_supabase.py) and run the dashboard (see app_rerun) in memory mode
+    against it: the full table is fetched and filtered in the app.
+    """
+    records = table.astype(object).where(table.notna(), None).to_dict('records')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), stub_supabase.StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with stub_supabase.LOCK:
+        stub_supabase.TABLES['invoices'] = records
+    try:
+        return app_rerun({'INVOICE_QUERY_MODE': 'memory',
+                          'SUPABASE_URL': f'http://127.0.0.1:{server.server_address[1]}'}, filters)
+    finally:
+        server.shutdown()
+        server.server_close()
+        with stub_supabase.LOCK:
+            stub_supabase.TABLES.pop('invoices', None)
+
+
+def run_metadata(args):
+    """
+    What a results file was measured on: commit, library versions and arguments.
+    """
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], capture_output=True, text=True, check=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'sizes': args.sizes,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'stages': args.stages,
+    }
+
+
+def compare_results(old, new):
+    """
+    Timings of two results files side by side: every *_s and *_ms column of
+    the stages both ran, matched on rows and the text columns (step, filter, ...).
+    """
+    compared = []
+    for stage_name, new_rows in new['results'].items():
+        if stage_name not in old['results'] or not new_rows:
+            continue
+        old_frame = pd.DataFrame(old['results'][stage_name])
+        new_frame = pd.DataFrame(new_rows)
+        timings = [col for col in new_frame.columns
+                   if (col.endswith('_s') or col.endswith('_ms') or col == 'ms') and col in old_frame.columns]
+        keys = ['rows'] + [col for col in new_frame.columns
+                           if new_frame[col].dtype == object and col in old_frame.columns]
+        merged = old_frame[keys + timings].merge(new_frame[keys + timings], on=keys, suffixes=('_old', '_new'))
+        for col in timings:
+            for _, row in merged.iterrows():
+                compared.append({
+                    'stage': stage_name,
+                    'case': ' '.join(str(row[key]) for key in keys),
+                    'measure': col,
+                    'old': row[f'{col}_old'],
+                    'new': row[f'{col}_new'],
+                    'ratio': round(row[f'{col}_new'] / row[f'{col}_old'], 2) if row[f'{col}_old'] else None,
+                })
+    return pd.DataFrame(compared, columns=['stage', 'case', 'measure', 'old', 'new', 'ratio'])
+
+
+def report_stage(report, name, title, results):
+    report[name] = results
+    print(f"\n{title}")
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's data preparation steps")
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="Comma-separated row counts to benchmark")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per measurement (best is kept)")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the synthetic data of the ingest and dashboard stages")
+    parser.add_argument('--stages', default='normalize,metrics',
+                        help="Comma-separated stages to run (normalize, metrics, columnar, pipeline, search, render, "
+                             "compact, filter, ingest, descriptions, dashboard)")
+    parser.add_argument('--json', help="Save the results, with the commit and versions, to this JSON file")
+    parser.add_argument('--compare', help="Compare the timings against an earlier --json results file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    stages = args.stages.split(',')
+    report = {}
+
+    if 'normalize' in stages:
+        report_stage(report, 'normalize', "Weight and date normalization:",
+                     [bench_normalize(rows, args.repeat) for rows in sizes])
+
+    if 'metrics' in stages:
+        report_stage(report, 'metrics', "Multiple Metrics Analysis (Daily, all metrics):",
+                     [bench_metrics(rows, 'Daily', args.repeat) for rows in sizes])
+
+    if 'columnar' in stages:
+        # Needs the optional duckdb package
+        report_stage(report, 'columnar', "Filtered rollup, pandas vs DuckDB store:",
+                     [result for rows in sizes for result in bench_columnar(rows, args.repeat)])
+
+    if 'pipeline' in stages:
+        report_stage(report, 'pipeline', "One filtered rerun, copies vs shared views (peak heap growth):",
+                     [bench_pipeline(rows) for rows in sizes])
+
+    if 'search' in stages:
+        report_stage(report, 'search', "Raw Data search, substring scan vs prebuilt index:",
+                     [result for rows in sizes for result in bench_search(rows)])
+
+    if 'render' in stages:
+        report_stage(report, 'render', "Daily weight-by-client chart, full vs render budget:",
+                     [bench_render(rows) for rows in sizes])
+
+    if 'compact' in stages:
+        report_stage(report, 'compact', "Cleaned invoices frame, object text columns vs compact:",
+                     [bench_compact(rows, args.repeat) for rows in sizes])
+
+    if 'filter' in stages:
+        report_stage(report, 'filter', "Sidebar filters, full scan vs position indexes:",
+                     [result for rows in sizes for result in bench_filter(rows, args.repeat)])
+
+    if 'ingest' in stages:
+        report_stage(report, 'ingest', "Synthetic export load (migrate_data.py):",
+                     [bench_ingest(rows, args.seed, args.repeat) for rows in sizes])
+
+    if 'descriptions' in stages:
+        report_stage(report, 'descriptions', "Item description parsing, every row vs distinct descriptions:",
+                     [bench_descriptions(rows, args.seed, args.repeat) for rows in sizes])
+
+    if 'dashboard' in stages:
+        report_stage(report, 'dashboard', "Dashboard rerun steps on a synthetic invoices table:",
+                     [result for rows in sizes for result in bench_dashboard(rows, args.seed, args.repeat)])
+
+    results = {'meta': run_metadata(args), 'results': report}
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2, default=str)
+        print(f"\nSaved results to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+        print(f"\nTimings against {args.compare} (commit {old['meta'].get('commit')}; ratio > 1 is slower):")
+        print(compare_results(old, results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
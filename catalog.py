@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Product lines recognized in item descriptions ("EpiX Powder, 50 lb bag").
+# A new line only needs adding to the catalog file; the built-in list is used
+# when the file is missing.
+PRODUCT_CATALOG_FILE = os.getenv("INVOICE_PRODUCT_CATALOG", "product_catalog.json")
+DEFAULT_PRODUCT_LINES = ('EpiX', 'KinetiX', 'DynamiX')
+
+# Parsed descriptions remembered between ingest runs ("" keeps them in memory only)
+DESCRIPTION_CACHE_FILE = os.getenv("INVOICE_DESCRIPTION_CACHE", "description_cache.json")
+DESCRIPTION_CACHE_ENTRIES = int(os.getenv("INVOICE_DESCRIPTION_CACHE_ENTRIES", "100000"))
+
+# "<product line> <form>, <unit weight> lb", anywhere in the description
+DESCRIPTION_FORMAT = r'({lines})\s+([^,]+),\s*(\d+)\s*lb'
+
+
+def load_product_lines(path=PRODUCT_CATALOG_FILE):
+    """
+    Product line names from the catalog file at `path`, or the built-in ones
+    when there is no such file.
+    """
+    if not path or not os.path.exists(path):
+        return list(DEFAULT_PRODUCT_LINES)
+    with open(path) as f:
+        catalog = json.load(f)
+    lines = [str(line).strip() for line in catalog.get('product_lines', [])]
+    if not lines or not all(lines):
+        raise ValueError(f"{path} needs a non-empty 'product_lines' list of names")
+    return lines
+
+
+def description_pattern(product_lines):
+    """
+    Compiled pattern capturing product line, form and unit weight. Longer
+    names are tried first, so a line named "EpiX Pro" is not read as EpiX.
+    """
+    names = sorted(dict.fromkeys(product_lines), key=len, reverse=True)
+    return re.compile(DESCRIPTION_FORMAT.format(lines='|'.join(re.escape(name) for name in names)))
+
+
+class DescriptionParser:
+    """
+    Material, form and unit weight of item descriptions, parsed once per
+    distinct description.
+
+    Exports repeat a few hundred SKU descriptions over millions of lines, so
+    a column is factorized, only descriptions not seen before are run
+    through the pattern, and the results are broadcast back by code. Parsed
+    descriptions stay in a bounded LRU cache that `save()` writes to
+    `cache_path` and the next run reads back. The cache is tied to the
+    pattern: changing the catalog starts a new one.
+    """
+
+    def __init__(self, product_lines=None, cache_path=None, max_entries=DESCRIPTION_CACHE_ENTRIES):
+        self.pattern = description_pattern(product_lines or load_product_lines())
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # description -> (material, form, weight) or (None, None, None)
+        self._changed = False
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                saved = json.load(f)
+            if saved.get('pattern') == self.pattern.pattern:
+                for description, material, form, weight in saved.get('entries', [])[-max_entries:]:
+                    self._cache[description] = (material, form, weight)
+
+    @property
+    def size(self):
+        # Descriptions currently cached
+        return len(self._cache)
+
+    def parse(self, description):
+        """
+        (material, form, weight) of one description, or (None, None, None)
+        when it names no catalog product.
+        """
+        if not isinstance(description, str):
+            return None, None, None
+        return self._lookup([description])[0]
+
+    def parse_column(self, descriptions):
+        """
+        Frame of material, material_form and weight (float, NaN when
+        unmatched) for a column of descriptions, aligned with its index.
+        """
+        codes, uniques = pd.factorize(descriptions)
+        parsed = self._lookup([value if isinstance(value, str) else None for value in uniques])
+
+        # One slot past the uniques for missing descriptions (code -1)
+        materials = np.array([material for material, _, _ in parsed] + [None], dtype=object)
+        forms = np.array([form for _, form, _ in parsed] + [None], dtype=object)
+        weights = np.array([np.nan if weight is None else weight for _, _, weight in parsed] + [np.nan],
+                           dtype='float64')
+        return pd.DataFrame({
+            'material': materials[codes],
+            'material_form': forms[codes],
+            'weight': weights[codes],
+        }, index=descriptions.index)
+
+    def _lookup(self, descriptions):
+        results = []
+        misses = []
+        for description in descriptions:
+            if description is None:
+                results.append((None, None, None))
+                continue
+            result = self._cache.get(description)
+            if result is None:
+                misses.append((len(results), description))
+            else:
+                self._cache.move_to_end(description)
+            results.append(result)
+
+        for position, description in misses:
+            match = self.pattern.search(description)
+            result = (match.group(1), match.group(2), int(match.group(3))) if match else (None, None, None)
+            self._cache[description] = result
+            results[position] = result
+        if misses:
+            self._changed = True
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return results
+
+    def save(self):
+        """
+        Write the cache to `cache_path`, least recently used first, if it changed.
+        """
+        if not self.cache_path or not self._changed:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'pattern': self.pattern.pattern,
+                'entries': [[description, *result] for description, result in self._cache.items()],
+                'updated_at': time.time(),
+            }, f)
+        os.replace(tmp_path, self.cache_path)
+        self._changed = False
+
+
+_default_parser = None
+
+
+def get_description_parser():
+    """
+    The parser of this process for the configured catalog, with the cache
+    saved by earlier ingest runs.
+    """
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = DescriptionParser(load_product_lines(), DESCRIPTION_CACHE_FILE)
+    return _default_parser
@@ -0,0 +1,137 @@
+import argparse
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from data_loader import INVOICE_COLUMNS, clean_invoices
+
+# Local columnar copy of the cleaned invoices for INVOICE_QUERY_MODE=duckdb.
+# A .parquet path is written as a Parquet snapshot, anything else as a DuckDB file.
+COLUMNAR_PATH = os.getenv("INVOICE_COLUMNAR_PATH", "invoices.duckdb")
+
+# Table holding the cleaned invoice lines inside the DuckDB file
+COLUMNAR_TABLE = 'invoice_lines'
+
+# Store types of the cleaned invoice columns; every other column is text
+COLUMN_TYPES = {
+    'id': 'BIGINT',
+    'date': 'TIMESTAMP',
+    'quantity': 'DOUBLE',
+    'amount': 'DOUBLE',
+    'weight_value': 'DOUBLE',
+    'total_weight_value': 'DOUBLE',
+}
+
+# Filter and grouping columns stored as ENUMs: grouping and comparing small
+# integer codes is several times faster than hashing the strings
+ENUM_COLUMNS = ('customer_name', 'material', 'material_form')
+
+
+def import_duckdb():
+    """
+    Import the optional duckdb package with a hint on how to get it.
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The columnar engine needs the duckdb package: pip install duckdb") from e
+    return duckdb
+
+
+def iter_sqlite_frames(db_path='invoices.db', chunksize=200000, columns=INVOICE_COLUMNS):
+    """
+    Read the invoices table of a SQLite database as cleaned frames of `chunksize` rows.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        for chunk in pd.read_sql_query(f"SELECT {', '.join(columns)} FROM invoices ORDER BY id",
+                                       conn, chunksize=chunksize):
+            yield clean_invoices(chunk)
+    finally:
+        conn.close()
+
+
+def iter_supabase_frames(columns=INVOICE_COLUMNS):
+    """
+    Pull the Supabase invoices table (range paged, see data_loader.fetch_invoices) as one cleaned frame.
+    """
+    from data_loader import fetch_invoices, get_supabase_client
+
+    raw, _ = fetch_invoices(get_supabase_client(), columns)
+    yield clean_invoices(raw)
+
+
+def build_store(frames, path=COLUMNAR_PATH):
+    """
+    Write cleaned invoice frames to a columnar store at `path`, sorted by date.
+
+    The store is built next to `path` and moved into place at the end, so a
+    running dashboard keeps reading the previous snapshot until it is done.
+    Returns the number of lines written.
+    """
+    duckdb = import_duckdb()
+    parquet = path.endswith('.parquet')
+    staging = f'{path}.building'
+    if os.path.exists(staging):
+        os.remove(staging)
+
+    # Parquet output is staged in an in-memory database and copied out at the end
+    conn = duckdb.connect(':memory:' if parquet else staging)
+    conn.execute('SET enable_progress_bar = false')
+    rows = 0
+    try:
+        for frame in frames:
+            if frame.empty:
+                continue
+            if rows == 0:
+                schema = ', '.join(f'"{col}" {COLUMN_TYPES.get(col, "VARCHAR")}' for col in frame.columns)
+                conn.execute(f'CREATE TABLE staged ({schema})')
+            conn.register('frame', frame)
+            conn.execute('INSERT INTO staged BY NAME SELECT * FROM frame')
+            conn.unregister('frame')
+            rows += len(frame)
+        if rows == 0:
+            raise ValueError("No invoice rows to write")
+
+        for col in ENUM_COLUMNS:
+            conn.execute(f'CREATE TYPE {col}_values AS ENUM '
+                         f'(SELECT DISTINCT {col} FROM staged WHERE {col} IS NOT NULL ORDER BY 1)')
+        casts = ', '.join(f'CAST({col} AS {col}_values) AS {col}' for col in ENUM_COLUMNS)
+        # `day` is the date the filters and rollups work on. Date order keeps
+        # the row groups of a date range together, so range filters skip the rest.
+        select = f'SELECT * REPLACE ({casts}), CAST(date AS DATE) AS day FROM staged ORDER BY date, id'
+        if parquet:
+            conn.execute(f"COPY ({select}) TO '{staging}' (FORMAT parquet, COMPRESSION zstd)")
+        else:
+            conn.execute(f'CREATE TABLE {COLUMNAR_TABLE} AS {select}')
+            conn.execute('DROP TABLE staged')
+            conn.execute('CHECKPOINT')
+    finally:
+        conn.close()
+
+    os.replace(staging, path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the columnar invoice store used by INVOICE_QUERY_MODE=duckdb")
+    parser.add_argument('--source', choices=['sqlite', 'supabase'], default='sqlite',
+                        help="Read invoices from invoices.db or from Supabase")
+    parser.add_argument('--db', default='invoices.db', help="SQLite database for --source sqlite")
+    parser.add_argument('--out', default=COLUMNAR_PATH,
+                        help="Output path: .duckdb for a DuckDB file, .parquet for a Parquet snapshot")
+    parser.add_argument('--chunksize', type=int, default=200000, help="Rows read from SQLite at a time")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frames = iter_sqlite_frames(args.db, args.chunksize) if args.source == 'sqlite' else iter_supabase_frames()
+    rows = build_store(frames, args.out)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {rows:,} invoice lines to {args.out} in {elapsed:.2f}s "
+          f"({os.path.getsize(args.out) / 1024 / 1024:,.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
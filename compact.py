@@ -0,0 +1,97 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Repetitive text columns kept as categoricals: one small integer code per
+# row plus one copy of each distinct value
+CATEGORY_COLUMNS = ('customer_name', 'material', 'material_form', 'type', 'account', 'item_description')
+
+# Raw text columns that clean_invoices() parses into weight_value / total_weight_value
+PARSED_TEXT_COLUMNS = ('weight', 'total_weight')
+
+# Float columns that are displayed but never summed, stored as float32 when
+# that loses nothing; summed measures (amount, total weight) stay float64
+FLOAT32_COLUMNS = ('quantity', 'weight_value')
+
+
+def bytes_per_row(df):
+    """
+    Memory used per row of `df`, strings included.
+    """
+    return int(df.memory_usage(deep=True, index=False).sum()) // max(len(df), 1)
+
+
+def memory_bytes(value):
+    """
+    Approximate memory held by a cached value: frames and series (strings
+    included), anything with an `nbytes` (arrays, indexes) and tuples of those.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, tuple):
+        return sum(memory_bytes(item) for item in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def compact_invoices(df):
+    """
+    Shrink a cleaned invoices frame for caching.
+
+    The repetitive text columns become categoricals, the weight text already
+    parsed into numbers is dropped, integer columns take the smallest type
+    that holds them and the unsummed float columns become float32 where every
+    value survives the conversion.
+    """
+    df = df.drop(columns=[col for col in PARSED_TEXT_COLUMNS if col in df.columns])
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns and df[col].dtype == 'float64':
+            narrow = df[col].astype('float32')
+            if np.array_equal(narrow.to_numpy(dtype='float64'), df[col].to_numpy(), equal_nan=True):
+                df[col] = narrow
+    return df
+
+
+def drop_unused_categories(frame):
+    """
+    Drop the categories no row of `frame` uses, in place, and return it.
+
+    A filtered frame keeps every category of the full table; plotly facets
+    and groups on the full category list and fails on the empty ones.
+    """
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].cat.remove_unused_categories()
+    return frame
+
+
+def concat_compact(frames):
+    """
+    Concatenate compact frames, keeping categorical columns categorical.
+
+    pandas falls back to object columns when the categories differ, so the
+    categories of every frame are first widened to their union.
+    """
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    columns = [col for col in frames[0].columns
+               if all(col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames)]
+    widened = [frame.copy(deep=False) for frame in frames]
+    for col in columns:
+        categories = frames[0][col].cat.categories
+        for frame in frames[1:]:
+            categories = categories.union(frame[col].cat.categories)
+        for frame in widened:
+            frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(widened, ignore_index=True)
@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import tempfile
+
+# Rows converted and written per step of an export
+EXPORT_CHUNK_ROWS = int(os.getenv("INVOICE_EXPORT_CHUNK_ROWS", "100000"))
+
+# Download formats offered by the Raw Data tab: file extension and MIME type
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Parquet is written with pyarrow (in requirements.txt); without it only CSV is
+# offered. Only looked up here: write_parquet imports it on the first export.
+if importlib.util.find_spec('pyarrow') is None:
+    del EXPORT_FORMATS['Parquet']
+
+
+def write_csv(frames, file):
+    """
+    Append each frame to `file` as CSV, with the header written once.
+    """
+    for number, frame in enumerate(frames):
+        file.write(frame.to_csv(index=False, header=number == 0).encode())
+
+
+def write_parquet(frames, file):
+    """
+    Write the frames to `file` as one zstd-compressed Parquet file, one row group per frame.
+
+    The schema comes from the first frame; columns it leaves untyped (all
+    missing) are written as text.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for frame in frames:
+            if writer is None:
+                schema = pa.Schema.from_pandas(frame, preserve_index=False)
+                for i, field in enumerate(schema):
+                    if pa.types.is_null(field.type):
+                        schema = schema.set(i, field.with_type(pa.string()))
+                writer = pq.ParquetWriter(file, schema, compression='zstd')
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_bytes(frames, export_format):
+    """
+    Encode an iterable of display frames in `export_format` (see EXPORT_FORMATS).
+
+    The frames are consumed and written one at a time through a temporary
+    file, so only one chunk of rows is converted in memory at any point.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format!r}; expected one of {list(EXPORT_FORMATS)}")
+    with tempfile.TemporaryFile() as file:
+        if export_format == 'CSV':
+            write_csv(frames, file)
+        else:
+            write_parquet(frames, file)
+        file.seek(0)
+        return file.read()
@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+import pandas as pd
+import streamlit as st
+
+from pipeline import DerivedCache
+from render_budget import figure_payload_bytes
+from timing import stage
+
+# Plotly figures kept across reruns and sessions
+FIGURE_CACHE_ENTRIES = int(os.getenv("INVOICE_FIGURE_CACHE_ENTRIES", "256"))
+
+# Build and send only the dashboard view that is shown (INVOICE_LAZY_TABS=0 renders all four as tabs)
+LAZY_TABS = os.getenv("INVOICE_LAZY_TABS", "1") != "0"
+
+
+def frame_digest(inputs):
+    """
+    Content hash of the frames (or series) a chart is drawn from: values,
+    index, column names and dtypes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for data in inputs:
+        dtypes = data.dtypes.items() if isinstance(data, pd.DataFrame) else [(data.name, data.dtype)]
+        digest.update(repr([(name, str(dtype)) for name, dtype in dtypes]).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+@st.cache_resource
+def get_figure_cache():
+    """
+    Return the figure cache shared by every session of this server process.
+    """
+    return DerivedCache(max_entries=FIGURE_CACHE_ENTRIES)
+
+
+def cached_figure(name, inputs, options, build, measure=False):
+    """
+    Figure `name` drawn from the aggregated `inputs` with the layout
+    `options` (a tuple of titles, aggregation level, ...); `build()` only
+    runs when one of them changed. Cached figures are shared and must not be
+    modified after they are returned.
+
+    With `measure`, returns (figure, payload bytes), the payload measured
+    once per build.
+    """
+    built = []
+
+    def build_entry():
+        built.append(True)
+        fig = build()
+        return fig, figure_payload_bytes(fig) if measure else None
+
+    with stage(f'chart:{name}') as timed:
+        fig, payload_bytes = get_figure_cache().get((name, frame_digest(inputs), options, measure), build_entry)
+        timed.note(rows=sum(len(data) for data in inputs), built=bool(built))
+        if measure:
+            timed.note(bytes=payload_bytes)
+    return (fig, payload_bytes) if measure else fig
+
+
+def show_figure(name, fig, **kwargs):
+    """
+    `st.plotly_chart(fig, **kwargs)`, timed as the stage 'plot:<name>'
+    (Streamlit serializes the figure to JSON here).
+    """
+    with stage(f'plot:{name}'):
+        st.plotly_chart(fig, **kwargs)
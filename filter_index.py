@@ -0,0 +1,99 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Sidebar filter columns indexed by value
+FILTER_COLUMNS = ('material', 'material_form', 'customer_name')
+
+
+def sort_by_date(frame, column='date'):
+    """
+    Rows of `frame` ordered by `column`, missing dates last; rows on the same
+    date keep their order and their index labels.
+    """
+    if is_date_sorted(frame[column]):
+        return frame
+    return frame.sort_values(column, kind='stable', na_position='last')
+
+
+def is_date_sorted(dates):
+    """
+    Whether `dates` is in sort_by_date() order: increasing, missing dates last.
+    """
+    known = int(dates.notna().sum())
+    return bool(dates.iloc[:known].notna().all() and dates.iloc[:known].is_monotonic_increasing)
+
+
+class FilterIndex:
+    """
+    Row positions of a frame sorted by date (see sort_by_date), for the sidebar filters.
+
+    The date range is a searchsorted slice of the dates. Each value of the
+    filter columns maps to its row positions, stored in row (so date) order,
+    and the date range is a searchsorted slice of those too. A filter
+    combination starts from the smallest of these slices and checks the
+    other columns on its rows only, so it costs about the size of its result
+    rather than a scan of the table.
+    """
+
+    def __init__(self, frame, date_column, columns=FILTER_COLUMNS):
+        self.rows = len(frame)
+        dates = frame[date_column]
+        if not is_date_sorted(dates):
+            raise ValueError(f"Frame is not sorted by {date_column!r}; use sort_by_date() first")
+        # Missing dates are sorted last and never match a date range
+        self._dates = dates.to_numpy()[:int(dates.notna().sum())]
+        self._values = {}
+        for col in columns:
+            if col not in frame.columns:
+                continue
+            codes, uniques = pd.factorize(frame[col])
+            codes = codes.astype(np.int32)
+            order = np.argsort(codes, kind='stable').astype(np.int64)
+            offsets = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            lookup = {value: code for code, value in enumerate(uniques)}
+            self._values[col] = (codes, order, offsets, lookup)
+
+    @property
+    def nbytes(self):
+        # Arrays plus the value lookups, for the invoice cache's memory budget
+        return self._dates.nbytes + sum(
+            codes.nbytes + order.nbytes + offsets.nbytes + sys.getsizeof(lookup)
+            for codes, order, offsets, lookup in self._values.values()
+        )
+
+    def _date_bounds(self, date_range):
+        # Inclusive on both ends, comparing whole days like pipeline.filter_mask
+        if date_range is None or len(date_range) != 2:
+            return 0, self.rows
+        start = pd.Timestamp(date_range[0]).to_datetime64()
+        end = (pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).to_datetime64()
+        return (int(np.searchsorted(self._dates, start, side='left')),
+                int(np.searchsorted(self._dates, end, side='left')))
+
+    def positions(self, date_range=None, **values):
+        """
+        Ascending positions of the rows in `date_range` whose columns equal
+        `values` (column=value keywords; 'All' or None leaves a column unfiltered).
+        """
+        start, end = self._date_bounds(date_range)
+        matches = []
+        for col, value in values.items():
+            if value is None or value == 'All':
+                continue
+            codes, order, offsets, lookup = self._values[col]
+            code = lookup.get(value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            rows = order[offsets[code]:offsets[code + 1]]
+            rows = rows[np.searchsorted(rows, start):np.searchsorted(rows, end)]
+            matches.append((len(rows), col, code, rows))
+        if not matches:
+            return np.arange(start, end)
+
+        matches.sort(key=lambda match: match[0])
+        positions = matches[0][3]
+        for _, col, code, _ in matches[1:]:
+            positions = positions[self._values[col][0][positions] == code]
+        return positions
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from rollups import summarize
+
+# Metrics offered in the "Multiple Metrics Analysis" panel.
+#
+# Each metric is declared as an aggregation of one invoice-line column so
+# that every selected metric is computed in one grouped pass over the lines:
+#   column: line column to aggregate
+#   agg:    pandas aggregation name applied per period ('sum', 'mean', ...)
+#   scale:  optional factor applied to the result (-1 flips stored income)
+#   by:     optional inner grouping; `agg` is then applied per period x `by`
+#           and `then` combines the inner results per period
+# A metric can instead give `func`, a callable taking one period's lines,
+# for aggregations that cannot be declared this way.
+#   rollup: optional equivalent over the profit rollup (rollups.add_profit),
+#           used when the lines are not available (query mode). `column` is
+#           a column of rollups.summarize(); `scale`, `by` and `then` work as
+#           above. Metrics without it need the invoice lines.
+METRICS = {
+    'Total Revenue': {'column': 'amount', 'agg': 'sum', 'scale': -1,
+                      'rollup': {'column': 'amount', 'scale': -1}},
+    'Average Order Value': {'column': 'amount', 'agg': 'mean', 'scale': -1,
+                            'rollup': {'column': 'avg_order_value'}},
+    'Profit per Order': {'column': 'profit', 'agg': 'mean',
+                         'rollup': {'column': 'profit_per_order'}},
+    'Orders per Customer': {'column': 'customer_name', 'agg': 'size', 'by': 'customer_name', 'then': 'mean',
+                            'rollup': {'column': 'line_count', 'by': 'customer_name', 'then': 'mean'}},
+    # Over lines with revenue only, in both forms (see pipeline.derive_lines and rollups.build_daily_rollup)
+    'Average Margin': {'column': 'margin', 'agg': 'mean',
+                       'rollup': {'column': 'margin'}},
+    'Total Weight per Order': {'column': 'total_weight_value', 'agg': 'mean',
+                               'rollup': {'column': 'avg_order_size'}},
+}
+
+
+def register_metric(name, spec, metrics=METRICS):
+    """
+    Add or replace a metric in the registry (see METRICS for the spec format).
+    """
+    if 'func' not in spec and ('column' not in spec or 'agg' not in spec):
+        raise ValueError(f"Metric {name!r} needs either 'func' or 'column' and 'agg'")
+    if 'by' in spec and 'then' not in spec:
+        raise ValueError(f"Metric {name!r} groups by {spec['by']!r} but has no 'then' aggregation")
+    metrics[name] = spec
+
+
+def _restore_infinities(values, column, period, agg):
+    """
+    Grouped sum/mean turn a group containing inf into NaN (compensated
+    summation computes inf - inf); give those groups the inf (or NaN when
+    both signs occur) that a plain Series sum/mean returns.
+    """
+    if agg not in ('sum', 'mean') or column.dtype.kind != 'f':
+        return values
+    positive = np.isposinf(column)
+    negative = np.isneginf(column)
+    if not (positive.any() or negative.any()):
+        return values
+    positive = positive.groupby(period).any().reindex(values.index, fill_value=False)
+    negative = negative.groupby(period).any().reindex(values.index, fill_value=False)
+    values = values.mask(positive, np.inf).mask(negative, -np.inf)
+    return values.mask(positive & negative, np.nan)
+
+
+def metrics_over_time(df, period, names, metrics=METRICS):
+    """
+    Compute the metrics `names` of the invoice lines `df` for each value of `period`.
+
+    Returns one row per period (sorted) with a 'period' column and one
+    column per metric.
+    """
+    grouped = df.groupby(period, sort=True)
+    periods = grouped.size().index.rename('period')
+    result = pd.DataFrame(index=periods)
+
+    for name in names:
+        spec = metrics[name]
+        if 'func' in spec:
+            values = grouped.apply(spec['func'])
+        elif 'by' in spec:
+            inner = df.groupby([period, df[spec['by']]], sort=False, observed=True)[spec['column']].agg(spec['agg'])
+            values = inner.groupby(level=0).agg(spec['then'])
+        else:
+            values = grouped[spec['column']].agg(spec['agg'])
+            values = _restore_infinities(values, df[spec['column']], period, spec['agg'])
+        values = values.reindex(periods)
+        if 'scale' in spec:
+            values = values * spec['scale']
+        result[name] = values.to_numpy()
+
+    return result.reset_index()
+
+
+def rollup_metric_names(metrics=METRICS):
+    """
+    Metrics that can be computed from the rollup alone.
+    """
+    return [name for name, spec in metrics.items() if 'rollup' in spec]
+
+
+def metrics_from_rollup(profit_rollup, period, names, metrics=METRICS):
+    """
+    Compute the metrics `names` per period from profit rollup rows instead of lines.
+
+    Margins are averaged over lines with revenue, as in the overview metrics.
+    """
+    rollup = profit_rollup.assign(period=period)
+    summary = summarize(rollup, 'period').set_index('period')
+    result = pd.DataFrame(index=summary.index)
+
+    for name in names:
+        spec = metrics[name]['rollup']
+        if 'by' in spec:
+            inner = summarize(rollup, ['period', spec['by']])
+            values = inner.groupby('period')[spec['column']].agg(spec['then'])
+        else:
+            values = summary[spec['column']]
+        values = values.reindex(summary.index)
+        if 'scale' in spec:
+            values = values * spec['scale']
+        result[name] = values.to_numpy()
+
+    return result.reset_index()
@@ -1,88 +1,240 @@
+import argparse
 import pandas as pd
-import re
 import sqlite3
+import time
+from contextlib import nullcontext
 
-def process_material_description(description):
+from catalog import get_description_parser
+from normalize import format_excel_dates
+from rollups import refresh_sqlite_rollup
+
+def process_material_description(description, parser=None):
     """
     Process a material description string to extract material, form, and weight.
     Returns tuple of (material, form, weight) or (None, None, None) if no match.
+    Product lines come from the catalog (see catalog.py).
     """
-    if not isinstance(description, str):
-        return None, None, None
-        
-    # Pattern to match material descriptions
-    pattern = r'(EpiX|KinetiX|DynamiX)\s+([^,]+),\s*(\d+)\s*lb'
-    
-    match = re.search(pattern, description)
-    if match:
-        material = match.group(1)
-        form = match.group(2)
-        weight = int(match.group(3))  # Convert to integer for calculations
-        return material, form, weight
-    return None, None, None
+    if parser is None:
+        parser = get_description_parser()
+    return parser.parse(description)
+
+# Column types for the QuickBooks export (header names keep their trailing space)
+CSV_DTYPES = {
+    'Date ': str,
+    'Document Number ': str,
+    'Name ': str,
+    'Memo ': str,
+    'Account ': str,
+    'Qty ': str,
+    'Amount ': str,
+    'Item: Description (Sales) ': str,
+    'Item: Item Type ': str,
+    '\ufeffType ': str,
+    'Type ': str
+}
+
+# Columns of the invoices table in the order the bulk insert binds them
+INSERT_COLUMNS = [
+    'type', 'date', 'document_number', 'customer_name', 'memo', 'account',
+    'quantity', 'amount', 'item_description', 'item_type',
+    'material', 'material_form', 'weight', 'total_weight',
+    'weight_lbs', 'total_weight_lbs', 'invoice_date'
+]
+
+# Rows per executemany() call during bulk inserts
+INSERT_BATCH_SIZE = 50000
+
+# Pragmas for bulk loading: the import can simply be rerun if the box dies mid-load
+BULK_PRAGMAS = [
+    'PRAGMA journal_mode = MEMORY',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -200000',
+]
+
+def add_material_columns(df, parser=None):
+    """
+    Extract material, form and weight from the descriptions (once per
+    distinct description) and calculate total weight from the quantity.
+    """
+    if parser is None:
+        parser = get_description_parser()
+    parts = parser.parse_column(df['Item: Description (Sales) '])
+    weight = parts['weight']
+
+    # Calculate total weight using the absolute quantity
+    qty = pd.to_numeric(df['Qty '], errors='coerce').abs()
+    total_weight = (weight * qty).dropna().astype('int64')
+
+    df['material'] = parts['material']
+    df['material_form'] = parts['material_form']
+    df['weight'] = (weight.dropna().astype('int64').astype(str) + ' lbs').reindex(df.index)
+    df['total_weight'] = (total_weight.astype(str) + ' lbs').reindex(df.index)
+    df['weight_lbs'] = weight
+    df['total_weight_lbs'] = total_weight.reindex(df.index)
+
+    # Typed invoice date (Excel serial or date string) as YYYY-MM-DD
+    df['invoice_date'] = format_excel_dates(df['Date '].str.strip())
+    return df
 
-def process_data(input_file):
+def process_data(input_file, parser=None):
     """
     Process the CSV file to extract material information and calculate total weight.
     """
     # Read the CSV file with string data types for relevant columns
-    df = pd.read_csv(input_file, skipinitialspace=True, dtype={
-        'Date ': str,
-        'Document Number ': str,
-        'Name ': str,
-        'Memo ': str,
-        'Account ': str,
-        'Qty ': str,
-        'Amount ': str,
-        'Item: Description (Sales) ': str,
-        'Item: Item Type ': str,
-        '\ufeffType ': str,
-        'Type ': str
-    })
-    
-    # Create new columns
-    new_cols = {
-        'material': [],
-        'material_form': [],
-        'weight': [],
-        'total_weight': []
-    }
-    
-    # Process each row
-    for idx, row in df.iterrows():
-        material, form, weight = process_material_description(row['Item: Description (Sales) '])
-        
-        # Store base columns
-        new_cols['material'].append(material)
-        new_cols['material_form'].append(form)
-        new_cols['weight'].append(f"{weight} lbs" if weight is not None else None)
-        
-        # Calculate total weight using quantity
-        if weight is not None and pd.notna(row['Qty ']):
-            try:
-                qty = abs(float(row['Qty ']))  # Convert to positive float
-                total_weight = weight * qty
-                new_cols['total_weight'].append(f"{int(total_weight)} lbs")
-            except (ValueError, TypeError):
-                new_cols['total_weight'].append(None)
-        else:
-            new_cols['total_weight'].append(None)
-    
-    # Add new columns to dataframe
-    for col_name, col_data in new_cols.items():
-        df[col_name] = col_data
-    
-    return df
+    df = pd.read_csv(input_file, skipinitialspace=True, dtype=CSV_DTYPES)
+    return add_material_columns(df, parser)
+
+def prepare_rows(processed_df):
+    """
+    Build the invoices rows for a processed frame, in INSERT_COLUMNS order.
+
+    Missing values are left as NaN: SQLite stores a bound NaN as NULL.
+    """
+    def text(col):
+        # str() of a missing value is 'nan', as the row-by-row insert stored it
+        return processed_df[col].astype(str).str.strip()
+
+    def optional_text(col):
+        return processed_df[col].str.strip().fillna('')
+
+    def number(col):
+        return pd.to_numeric(processed_df[col].str.strip(), errors='raise').fillna(0.0).astype(float)
+
+    type_col = '\ufeffType ' if '\ufeffType ' in processed_df.columns else 'Type '
+    return pd.DataFrame({
+        'type': text(type_col),
+        'date': text('Date '),
+        'document_number': text('Document Number '),
+        'customer_name': text('Name '),
+        'memo': text('Memo '),
+        'account': text('Account '),
+        'quantity': number('Qty '),
+        'amount': number('Amount '),
+        'item_description': optional_text('Item: Description (Sales) '),
+        'item_type': optional_text('Item: Item Type '),
+        'material': processed_df['material'],
+        'material_form': processed_df['material_form'],
+        'weight': processed_df['weight'],
+        'total_weight': processed_df['total_weight'],
+        'weight_lbs': processed_df['weight_lbs'].astype(float),
+        'total_weight_lbs': processed_df['total_weight_lbs'].astype(float),
+        'invoice_date': processed_df['invoice_date'],
+    }, columns=INSERT_COLUMNS)
+
+def insert_rows(conn, rows, batch_size=INSERT_BATCH_SIZE, commit=True):
+    """
+    Insert prepared rows with executemany() in batches inside one transaction
+    (the caller's open one with `commit=False`).
+    """
+    sql = f"""
+        INSERT INTO invoices ({', '.join(INSERT_COLUMNS)})
+        VALUES ({', '.join('?' for _ in INSERT_COLUMNS)})
+    """
+    with conn if commit else nullcontext():
+        for start in range(0, len(rows), batch_size):
+            batch = rows.iloc[start:start + batch_size]
+            # Column-wise tolist() is much cheaper than iterating rows
+            conn.executemany(sql, zip(*(batch[col].tolist() for col in INSERT_COLUMNS)))
+
+def load_rows(conn, processed_df):
+    """
+    Insert processed rows and recompute the daily rollup of the days they
+    touch in one transaction: either both are committed or neither is.
+    """
+    with conn:
+        insert_rows(conn, prepare_rows(processed_df), commit=False)
+        refresh_sqlite_rollup(conn, processed_df['invoice_date'].dropna().unique(), commit=False)
+
+def connect_for_bulk_load(db_path='invoices.db'):
+    conn = sqlite3.connect(db_path)
+    for pragma in BULK_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def stream_data(input_file, db_path='invoices.db', chunksize=100000, resume_from=0):
+    """
+    Process and insert the CSV one chunk at a time so memory stays bounded.
+
+    Each chunk is committed before the next one is read. `resume_from` skips
+    the first chunks without parsing them, so an interrupted load can be
+    restarted at the chunk it failed on.
+    """
+    # Skip already-loaded data lines but keep the header line
+    skiprows = range(1, resume_from * chunksize + 1) if resume_from else None
+    reader = pd.read_csv(input_file, skipinitialspace=True, dtype=CSV_DTYPES,
+                         chunksize=chunksize, skiprows=skiprows)
+
+    conn = connect_for_bulk_load(db_path)
+    material_counts = pd.Series(dtype='int64')
+    material_weights = pd.Series(dtype='float64')
+    rows_done = 0
+    started = time.perf_counter()
+    # Next chunk to load: every chunk before it is committed, rollup included
+    next_chunk = resume_from
+    try:
+        for chunk_number, chunk in enumerate(reader, start=resume_from):
+            processed = add_material_columns(chunk)
+            load_rows(conn, processed)
+            next_chunk = chunk_number + 1
+
+            # Keep running totals instead of the processed rows
+            material_counts = material_counts.add(processed['material'].value_counts(), fill_value=0)
+            material_weights = material_weights.add(
+                processed.groupby('material')['total_weight_lbs'].sum(), fill_value=0
+            )
+
+            rows_done += len(processed)
+            elapsed = time.perf_counter() - started
+            print(f"Chunk {chunk_number}: {rows_done:,} rows loaded "
+                  f"({rows_done / elapsed if elapsed else 0:,.0f} rows/s)")
+    except Exception:
+        print(f"Chunk {next_chunk} failed; earlier chunks are committed. "
+              f"Rerun with --resume-from {next_chunk} to continue.")
+        raise
+    finally:
+        conn.close()
+        # Descriptions parsed so far speed up the rerun too
+        get_description_parser().save()
+
+    print("\nMaterial counts:")
+    print(material_counts.astype('int64'))
+    print("\nTotal weight by material type:")
+    print(material_weights.map(lambda total: f"{int(total)} lbs"))
+    return rows_done
 
 def main():
     """
     Main function to process data and store in database
     """
-    input_file = 'riccitest1.csv'
+    parser = argparse.ArgumentParser(description="Load a QuickBooks invoice export into invoices.db")
+    parser.add_argument('input_file', nargs='?', default='riccitest1.csv')
+    parser.add_argument('--db', default='invoices.db', help="SQLite database to load into")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Stream the CSV in chunks of this many rows to bound memory use")
+    parser.add_argument('--resume-from', type=int, default=0,
+                        help="With --chunksize, skip chunks before this chunk number")
+    args = parser.parse_args()
+    input_file = args.input_file
+
+    if args.chunksize:
+        started = time.perf_counter()
+        rows = stream_data(input_file, args.db, args.chunksize, args.resume_from)
+        total = time.perf_counter() - started
+        print(f"\nLoaded {rows} rows in {total:.2f}s ({rows / total if total else 0:,.0f} rows/s)")
+        print("\nData migration completed successfully.")
+        return
     
     try:
+        started = time.perf_counter()
+
         # Process the data
         processed_df = process_data(input_file)
+        parsed = time.perf_counter()
+        description_parser = get_description_parser()
+        description_parser.save()
+        print(f"{processed_df['Item: Description (Sales) '].nunique()} distinct descriptions, "
+              f"{description_parser.size} remembered for the next run")
         
         # Print column types for debugging
         print("\nColumn dtypes:")
@@ -92,38 +244,12 @@ def main():
         print("\nFirst few rows:")
         print(processed_df.head())
         
-        # Connect to the SQLite database
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        
-        # Insert processed data into database
-        for idx, row in processed_df.iterrows():
-            cursor.execute('''
-                INSERT INTO invoices (
-                    type, date, document_number, customer_name, memo, account, 
-                    quantity, amount, item_description, item_type, 
-                    material, material_form, weight, total_weight
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                str(row['\ufeffType '] if '\ufeffType ' in row else row['Type ']).strip(),
-                str(row['Date ']).strip(),
-                str(row['Document Number ']).strip(),
-                str(row['Name ']).strip(),
-                str(row['Memo ']).strip(),
-                str(row['Account ']).strip(),
-                float(str(row['Qty ']).strip()) if pd.notna(row['Qty ']) else 0.0,
-                float(str(row['Amount ']).strip()) if pd.notna(row['Amount ']) else 0.0,
-                str(row['Item: Description (Sales) ']).strip() if pd.notna(row['Item: Description (Sales) ']) else '',
-                str(row['Item: Item Type ']).strip() if pd.notna(row['Item: Item Type ']) else '',
-                row['material'],
-                row['material_form'],
-                row['weight'],
-                row['total_weight']
-            ))
-        
-        # Commit changes
-        conn.commit()
+        # Connect to the SQLite database and insert processed data in bulk
+        conn = connect_for_bulk_load(args.db)
+        insert_started = time.perf_counter()
+        # Recompute the daily rollup for the days this export touched, in the same transaction
+        load_rows(conn, processed_df)
+        finished = time.perf_counter()
         
         # Display summary statistics
         print("\nMaterial counts:")
@@ -131,9 +257,9 @@ def main():
         print(material_counts)
         
         print("\nTotal weight by material type:")
-        material_weights = processed_df[processed_df['total_weight'].notna()].groupby('material').agg({
-            'total_weight': lambda x: f"{sum(int(w.replace(' lbs', '')) for w in x)} lbs"
-        })
+        material_weights = processed_df[processed_df['total_weight'].notna()].groupby('material').agg(
+            total_weight=('total_weight_lbs', lambda x: f"{int(x.sum())} lbs")
+        )
         print(material_weights)
         
         # Display sample of processed data
@@ -144,6 +270,12 @@ def main():
         print(sample_df)
         
         conn.close()
+
+        rows = len(processed_df)
+        total = finished - started
+        print(f"\nParsed {rows} rows in {parsed - started:.2f}s, "
+              f"inserted in {finished - insert_started:.2f}s "
+              f"({rows / total if total else 0:,.0f} rows/s overall)")
         print("\nData migration completed successfully.")
     except Exception as e:
         print(f"Error during data migration: {str(e)}")
@@ -1,58 +1,370 @@
-import sqlite3
-import pandas as pd
+import argparse
+import hashlib
+import json
 import os
-from dotenv import load_dotenv
-from supabase import create_client
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED, FIRST_COMPLETED
+
 import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
 
-def migrate_data():
-    # Initialize Supabase client
+# Upload settings (environment overrides the defaults)
+CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "1000"))
+WORKERS = int(os.getenv("MIGRATION_WORKERS", "4"))
+MAX_RETRIES = int(os.getenv("MIGRATION_MAX_RETRIES", "5"))
+CHECKPOINT_FILE = os.getenv("MIGRATION_CHECKPOINT_FILE", "supabase_migration_checkpoint.json")
+
+# Natural key for upsert syncs: the invoice document and the line within it
+SYNC_KEY = ('document_number', 'line_number')
+
+# SQLite invoice rows with their line number, counted within each document in id order
+NUMBERED_LINES = '''
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY document_number ORDER BY id) AS line_number
+    FROM invoices
+'''
+
+
+def make_session(supabase_key, workers=WORKERS, max_retries=MAX_RETRIES, idempotent=False):
+    """
+    Create a pooled HTTP session that retries failed POSTs with exponential backoff.
+
+    Only `idempotent` uploads (upserts on the natural key) are retried after
+    read timeouts and 500/502/504 responses, where the server may already
+    have committed the chunk. Plain inserts are retried only when the request
+    never reached the database: connection failures and 429/503 responses.
+    """
+    if idempotent:
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,  # Also retry POST: replaying an upsert cannot duplicate rows
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+    else:
+        retry = Retry(
+            total=max_retries,
+            read=0,
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=[429, 503],
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers), max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "apikey": supabase_key,
+        "Authorization": f"Bearer {supabase_key}",
+        "Content-Type": "application/json",
+        "Prefer": "return=minimal"
+    })
+    return session
+
+
+def iter_chunks(db_path, chunk_size=CHUNK_SIZE, after_id=0, skip_ranges=()):
+    """
+    Stream invoice rows from SQLite in id order, yielding (first_id, last_id, records) per chunk.
+
+    Rows whose id falls in one of `skip_ranges` (already uploaded) are left out.
+    The SQLite id column is not sent; Supabase assigns its own. Each record
+    carries its line_number, so later upsert syncs match the inserted rows on
+    SYNC_KEY instead of adding them again.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(f'SELECT * FROM ({NUMBERED_LINES}) WHERE id > ? ORDER BY id', (after_id,))
+        columns = [description[0] for description in cursor.description]
+        id_index = columns.index('id')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if skip_ranges:
+                rows = [row for row in rows
+                        if not any(first <= row[id_index] <= last for first, last in skip_ranges)]
+                if not rows:
+                    continue
+            records = [
+                {column: value for column, value in zip(columns, row) if column != 'id'}
+                for row in rows
+            ]
+            yield rows[0][id_index], rows[-1][id_index], records
+    finally:
+        conn.close()
+
+
+class Checkpoint:
+    """
+    Upload progress that survives an interrupted migration.
+
+    `last_id` is the highest SQLite id such that it and every id before it
+    have been acknowledged. Chunks finish out of order when uploaded
+    concurrently, so acknowledged chunks past that point are kept as
+    `done_ranges` and skipped on restart instead of being sent twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last_id = 0
+        self.done_ranges = []
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self.last_id = saved.get('last_id', 0)
+            self.done_ranges = [tuple(id_range) for id_range in saved.get('done_ranges', [])]
+        self._pending = {}  # chunk number -> [first_id, last_id, done]
+        self._next = 0
+
+    def started(self, chunk_number, first_id, last_id):
+        self._pending[chunk_number] = [first_id, last_id, False]
+
+    def finished(self, chunk_number):
+        self._pending[chunk_number][2] = True
+        while self._next in self._pending and self._pending[self._next][2]:
+            self.last_id = self._pending.pop(self._next)[1]
+            self._next += 1
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        done_ranges = self.done_ranges + [
+            (first_id, last_id) for first_id, last_id, done in self._pending.values() if done
+        ]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'last_id': self.last_id,
+                'done_ranges': sorted(id_range for id_range in done_ranges if id_range[1] > self.last_id),
+                'updated_at': time.time(),
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.last_id = 0
+        self.done_ranges = []
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def upload_chunk(session, url, records, headers=None):
+    response = session.post(url, json=records, headers=headers)
+    response.raise_for_status()
+    return len(records)
+
+
+def content_hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def ensure_sync_table(conn):
+    """
+    Create the table recording the content hash last synced for each natural key.
+    """
+    # WAL lets the hash updates commit while the changed-row scan is still reading
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS supabase_sync (
+            document_number TEXT,
+            line_number INTEGER,
+            content_hash TEXT,
+            synced_at REAL,
+            PRIMARY KEY (document_number, line_number)
+        )
+    ''')
+    conn.commit()
+
+
+def iter_changed_chunks(db_path, chunk_size=CHUNK_SIZE):
+    """
+    Stream rows that are new or changed since the last upsert sync.
+
+    Lines are numbered within each document in id order. Yields
+    (records, hashes) per chunk, where hashes are (document_number,
+    line_number, content_hash) tuples to record once the chunk is acknowledged.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_sync_table(conn)
+        cursor = conn.execute(f'''
+            SELECT lines.*, synced.content_hash AS synced_hash
+            FROM ({NUMBERED_LINES}) AS lines
+            LEFT JOIN supabase_sync AS synced
+                ON synced.document_number = lines.document_number
+                AND synced.line_number = lines.line_number
+            ORDER BY lines.id
+        ''')
+        columns = [description[0] for description in cursor.description]
+        records, hashes = [], []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                record = dict(zip(columns, row))
+                synced_hash = record.pop('synced_hash')
+                del record['id']
+                digest = content_hash(record)
+                if digest == synced_hash:
+                    continue
+                records.append(record)
+                hashes.append((record['document_number'], record['line_number'], digest))
+                if len(records) == chunk_size:
+                    yield records, hashes
+                    records, hashes = [], []
+        if records:
+            yield records, hashes
+    finally:
+        conn.close()
+
+
+def sync_data(db_path='invoices.db', chunk_size=CHUNK_SIZE, workers=WORKERS):
+    """
+    Upsert only new or changed rows into Supabase, keyed on SYNC_KEY.
+
+    Hashes are recorded per acknowledged chunk, so an interrupted sync simply
+    resends whatever is still unacknowledged the next time it runs.
+    """
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    url = f"{supabase_url}/rest/v1/invoices?on_conflict={','.join(SYNC_KEY)}"
+    headers = {"Prefer": "resolution=merge-duplicates,return=minimal"}
+
+    # Upserts on the natural key can be replayed safely
+    session = make_session(supabase_key, workers, idempotent=True)
+    state_conn = sqlite3.connect(db_path)
+    ensure_sync_table(state_conn)
+    started = time.perf_counter()
+    synced = 0
+
+    def acknowledge(done):
+        sent = 0
+        for future in done:
+            hashes = in_flight.pop(future)
+            sent += future.result()
+            now = time.time()
+            with state_conn:
+                state_conn.executemany(
+                    '''INSERT OR REPLACE INTO supabase_sync
+                       (document_number, line_number, content_hash, synced_at) VALUES (?, ?, ?, ?)''',
+                    [(document_number, line_number, digest, now)
+                     for document_number, line_number, digest in hashes]
+                )
+        return sent
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+            for records, hashes in iter_changed_chunks(db_path, chunk_size):
+                if len(in_flight) >= workers * 2:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    synced += acknowledge(done)
+                in_flight[pool.submit(upload_chunk, session, url, records, headers)] = hashes
+            done, _ = wait(list(in_flight))
+            synced += acknowledge(done)
+
+        elapsed = time.perf_counter() - started
+        print(f"Upserted {synced} new or changed records to Supabase in {elapsed:.2f}s")
+
+    except Exception as e:
+        print(f"Error syncing data: {str(e)}")
+        print(f"{synced} records were acknowledged; rerun to send the rest.")
+    finally:
+        state_conn.close()
+        session.close()
+
+
+def collect(in_flight, checkpoint, return_when=ALL_COMPLETED):
+    """
+    Wait for in-flight uploads, record finished chunks and return how many records they sent.
+    """
+    done, _ = wait(list(in_flight), return_when=return_when)
+    sent = 0
+    failure = None
+    for future in done:
+        chunk_number = in_flight.pop(future)
+        try:
+            sent += future.result()
+        except Exception as e:
+            failure = failure or e
+            continue
+        checkpoint.finished(chunk_number)
+    if failure is not None:
+        # Let the other uploads finish so the checkpoint is as far along as possible
+        if in_flight:
+            collect(in_flight, checkpoint)
+        raise failure
+    print(f"Migrated records up to SQLite id {checkpoint.last_id}")
+    return sent
+
+
+def migrate_data(db_path='invoices.db', chunk_size=CHUNK_SIZE, workers=WORKERS,
+                 checkpoint_file=CHECKPOINT_FILE, restart=False):
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_KEY")
-    supabase = create_client(supabase_url, supabase_key)
-    
+    url = f"{supabase_url}/rest/v1/invoices"
+
+    checkpoint = Checkpoint(checkpoint_file)
+    if restart:
+        checkpoint.clear()
+    if checkpoint.last_id:
+        print(f"Resuming after SQLite id {checkpoint.last_id}")
+
+    session = make_session(supabase_key, workers)
+    started = time.perf_counter()
+    migrated = 0
     try:
-        # Connect to SQLite database
-        sqlite_conn = sqlite3.connect('invoices.db')
-        
-        # Read data from SQLite
-        df = pd.read_sql_query("SELECT * FROM invoices", sqlite_conn)
-        sqlite_conn.close()
-        
-        # Remove the SQLite id column if it exists
-        if 'id' in df.columns:
-            df = df.drop('id', axis=1)
-        
-        # Convert DataFrame to list of dictionaries
-        records = df.to_dict('records')
-        
-        # Insert data into Supabase using REST API
-        headers = {
-            "apikey": supabase_key,
-            "Authorization": f"Bearer {supabase_key}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        }
-        
-        # Split records into chunks to avoid request size limits
-        chunk_size = 1000
-        for i in range(0, len(records), chunk_size):
-            chunk = records[i:i + chunk_size]
-            response = requests.post(
-                f"{supabase_url}/rest/v1/invoices",
-                headers=headers,
-                json=chunk
-            )
-            response.raise_for_status()
-            print(f"Migrated records {i} to {i + len(chunk)}")
-        
-        print(f"Successfully migrated {len(records)} records to Supabase")
-        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+            chunks = iter_chunks(db_path, chunk_size, checkpoint.last_id, checkpoint.done_ranges)
+            for chunk_number, (first_id, last_id, records) in enumerate(chunks):
+                # Keep a bounded number of chunks in memory at once
+                if len(in_flight) >= workers * 2:
+                    migrated += collect(in_flight, checkpoint, return_when=FIRST_COMPLETED)
+                checkpoint.started(chunk_number, first_id, last_id)
+                in_flight[pool.submit(upload_chunk, session, url, records)] = chunk_number
+            migrated += collect(in_flight, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        print(f"Successfully migrated {migrated} records to Supabase in {elapsed:.2f}s "
+              f"({migrated / elapsed if elapsed else 0:,.0f} records/s)")
+        checkpoint.clear()
+
     except Exception as e:
         print(f"Error migrating data: {str(e)}")
+        print(f"Acknowledged up to SQLite id {checkpoint.last_id}; rerun to resume from there.")
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload invoices.db to the Supabase invoices table")
+    parser.add_argument('--db', default='invoices.db', help="SQLite database to read from")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Records per POST")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Concurrent uploads")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help="Checkpoint file for resuming")
+    parser.add_argument('--restart', action='store_true', help="Ignore any checkpoint and start over")
+    parser.add_argument('--mode', choices=['insert', 'upsert'], default='insert',
+                        help="insert: append every row; upsert: send only new or changed rows, "
+                             "merged on document_number + line_number")
+    args = parser.parse_args()
+    if args.mode == 'upsert':
+        sync_data(args.db, args.chunk_size, args.workers)
+    else:
+        migrate_data(args.db, args.chunk_size, args.workers, args.checkpoint, args.restart)
+
 
 if __name__ == "__main__":
-    migrate_data()
\ No newline at end of file
+    main()
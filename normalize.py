@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# Excel serial dates count days from this origin
+EXCEL_ORIGIN = pd.Timestamp('1899-12-30')
+
+# Serial day numbers that fit in a nanosecond datetime64 column
+MIN_EXCEL_SERIAL = (pd.Timestamp.min.date() - EXCEL_ORIGIN.date()).days + 1
+MAX_EXCEL_SERIAL = (pd.Timestamp.max.date() - EXCEL_ORIGIN.date()).days - 1
+
+
+# Convert weight strings to numeric values
+def extract_weight(weight_str):
+    if pd.isna(weight_str) or weight_str is None:
+        return 0
+    try:
+        return float(weight_str.replace(' lbs', ''))
+    except (ValueError, AttributeError):
+        return 0
+
+
+# Convert Excel-style dates to datetime
+def excel_date_to_datetime(excel_date):
+    try:
+        # Try to convert to float first to handle Excel numeric dates
+        numeric_date = float(excel_date)
+        # Use 'excel' origin for proper conversion of Excel dates
+        return pd.to_datetime(numeric_date, unit='D', origin='1899-12-30')
+    except (ValueError, TypeError):
+        try:
+            # If not a number, try normal datetime parsing
+            return pd.to_datetime(excel_date)
+        except:
+            return None
+
+
+def _per_distinct(values, convert):
+    """
+    Apply the column-wise `convert` to the distinct values of `values` only.
+
+    Invoice columns repeat a small set of weights and dates, so converting the
+    factorized uniques and broadcasting back by code is much cheaper than
+    converting every row. Missing values are passed through as None.
+    """
+    codes, uniques = pd.factorize(values)
+    distinct = pd.Series(uniques, dtype=values.dtype if len(uniques) else object)
+    if (codes == -1).any():
+        distinct = pd.concat([distinct, pd.Series([None], dtype=object)], ignore_index=True)
+        codes = np.where(codes == -1, len(distinct) - 1, codes)
+    converted = convert(distinct)
+    return pd.Series(converted.to_numpy()[codes], index=values.index)
+
+
+def _extract_weights_distinct(weights):
+    is_str = weights.map(type).eq(str) if weights.dtype == object else pd.Series(False, index=weights.index)
+    stripped = weights.where(is_str).str.replace(' lbs', '', regex=False)
+    values = pd.to_numeric(stripped, errors='coerce')
+
+    # Non-strings (numbers, None, NaN) come out as 0 like the scalar helper
+    result = values.where(is_str, 0.0).astype('float64')
+
+    # Strings the fast path cannot parse ("1_000 lbs", "nan") go through the scalar helper
+    unparsed = is_str & values.isna()
+    if unparsed.any():
+        result[unparsed] = weights[unparsed].map(extract_weight).astype('float64')
+    return result
+
+
+def _excel_dates_distinct(dates):
+    result = pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns]')
+
+    serials = pd.to_numeric(dates, errors='coerce')
+    is_serial = serials.between(MIN_EXCEL_SERIAL, MAX_EXCEL_SERIAL)
+    if is_serial.any():
+        result[is_serial] = pd.to_datetime(serials[is_serial], unit='D', origin='1899-12-30')
+
+    is_text = dates.map(type).eq(str) & serials.isna() if dates.dtype == object else ~is_serial & False
+    if is_text.any():
+        # Parsed as UTC so mixed offsets still give one datetime column, then made naive
+        parsed = pd.to_datetime(dates[is_text], format='ISO8601', errors='coerce', utc=True)
+        if pd.api.types.is_datetime64_any_dtype(parsed):
+            result[is_text] = parsed.dt.tz_convert(None)
+
+    # Out-of-range serials, non-ISO strings and odd types take the slow path
+    leftover = dates.notna() & result.isna()
+    if leftover.any():
+        result[leftover] = pd.to_datetime(dates[leftover].map(_excel_date_utc_naive))
+    return result
+
+
+def _excel_date_utc_naive(value):
+    # excel_date_to_datetime(), with dates that carry an offset as their naive UTC time
+    converted = excel_date_to_datetime(value)
+    if isinstance(converted, pd.Timestamp) and converted.tzinfo is not None:
+        return converted.tz_convert(None)
+    return converted
+
+
+def extract_weights(weights):
+    """
+    Vectorized `extract_weight` for a whole column of "500 lbs" style strings.
+
+    Returns a float64 Series with the same values as applying `extract_weight`
+    row by row.
+    """
+    return _per_distinct(weights, _extract_weights_distinct).astype('float64')
+
+
+def excel_dates_to_datetime(dates):
+    """
+    Vectorized `excel_date_to_datetime` for a column mixing Excel serials and date strings.
+
+    Numeric values (and numeric strings) are converted as day offsets from the
+    Excel origin in one pass, the remaining strings are parsed as ISO 8601 in
+    a second pass. Anything left over goes through `excel_date_to_datetime`,
+    so the output matches the row-by-row helper, except that dates with a UTC
+    offset ("2023-01-05 10:00:00+02:00") are converted to naive UTC times
+    (08:00) so the column stays a single datetime64[ns] dtype.
+    """
+    return _per_distinct(dates, _excel_dates_distinct).astype('datetime64[ns]')
+
+
+def format_excel_dates(dates, date_format='%Y-%m-%d'):
+    """
+    Convert a column like `excel_dates_to_datetime` and format it as strings.
+
+    Formatting happens once per distinct input value; unparseable dates become NaN.
+    """
+    return _per_distinct(dates, lambda distinct: _excel_dates_distinct(distinct).dt.strftime(date_format))
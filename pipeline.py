@@ -0,0 +1,170 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from compact import drop_unused_categories, memory_bytes
+from rollups import add_profit, period_key
+
+# Memory budget for derived frames and chart aggregates kept across reruns
+DERIVED_CACHE_MAX_BYTES = int(os.getenv("INVOICE_DERIVED_CACHE_MB", "256")) * 1024 * 1024
+DERIVED_CACHE_MAX_ENTRIES = int(os.getenv("INVOICE_DERIVED_CACHE_ENTRIES", "512"))
+
+# Line columns used by the Detailed Profit Data table and the metrics panel
+LINE_COLUMNS = ['date', 'customer_name', 'material', 'material_form', 'total_weight_value', 'amount']
+
+# Invoice line id; the in-memory frame is sorted by date, so tables list
+# lines in invoice order by sorting on it
+ROW_ID = 'id'
+
+
+def filter_mask(frame, date_column, date_range=None, material='All', customer='All'):
+    """
+    Combined boolean mask of the sidebar filters, evaluated once per frame.
+
+    The date range is inclusive on both ends and compares whole days, like
+    `frame[date_column].dt.date` between the two picked dates.
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    if date_range is not None and len(date_range) == 2:
+        dates = frame[date_column]
+        start = pd.Timestamp(date_range[0])
+        end = pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+        mask &= ((dates >= start) & (dates < end)).to_numpy()
+    if material != 'All':
+        mask &= (frame['material'] == material).to_numpy()
+    if customer != 'All':
+        mask &= (frame['customer_name'] == customer).to_numpy()
+    return mask
+
+
+def take_columns(frame, columns, mask=None):
+    """
+    New frame holding only `columns` of the rows selected by `mask` (a
+    boolean mask or an array of row positions), gathered in one pass.
+    """
+    if mask is None:
+        return pd.DataFrame({col: frame[col].array for col in columns}, index=frame.index)
+    return pd.DataFrame({col: frame[col].array[mask] for col in columns}, index=frame.index[mask])
+
+
+def sorted_positions(frame, column=None, descending=False, mask=None, ties=None):
+    """
+    Positions of the rows selected by `mask`, ordered by `column`.
+
+    Missing values sort last and ties keep row order, or the order of the
+    `ties` column when given, so consecutive pages of the result never
+    overlap. Without a column the rows keep that order.
+    """
+    positions = np.arange(len(frame)) if mask is None else np.flatnonzero(mask)
+    if ties is not None:
+        positions = positions[np.argsort(frame[ties].to_numpy()[positions], kind='stable')]
+    if column is None:
+        return positions
+    values = pd.Series(frame[column].array[positions])
+    order = values.sort_values(ascending=not descending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+
+def derive_lines(df, mask, material_costs, agg_level):
+    """
+    Filtered invoice lines with profit, margin and period columns, built once per rerun.
+
+    The invoice id is kept when `df` has one, to list the lines in invoice order.
+    """
+    lines = take_columns(df, LINE_COLUMNS + [col for col in [ROW_ID] if col in df.columns], mask)
+    lines['cost_per_lb'] = lines['material_form'].map(material_costs).astype('float64')
+    lines['total_cost'] = lines['total_weight_value'] * lines['cost_per_lb']
+    lines['profit'] = -lines['amount'] - lines['total_cost']  # Negative amount because income is stored as negative
+    # Margin as a percentage of revenue; lines without revenue have none (NaN) and stay out of
+    # averages, as in the rollup's margin_lines
+    lines['margin'] = ((lines['profit'] / -lines['amount']) * 100).where(lines['amount'] != 0)
+    lines['period'] = period_key(lines['date'], agg_level)
+    return drop_unused_categories(lines)
+
+
+def derive_rollup(rollup, mask, material_costs, agg_level):
+    """
+    Filtered rollup rows (`mask` as in take_columns) with profit measures, the selected period and the
+    month (for the monthly heatmap), shared by every chart of the rerun.
+    """
+    rollup = add_profit(rollup if mask is None else rollup.iloc[mask], material_costs)
+    rollup['period'] = period_key(rollup['day'], agg_level)
+    rollup['month'] = rollup['period'] if agg_level == "Monthly" else period_key(rollup['day'], "Monthly")
+    return drop_unused_categories(rollup)
+
+
+def cost_table_key(material_costs):
+    """
+    Hashable snapshot of the session's cost per lb table.
+    """
+    return tuple(sorted(material_costs.items()))
+
+
+class DerivedCache:
+    """
+    Process-wide LRU cache of the frames derived on each rerun.
+
+    Keys are built from (data version, time aggregation, cost table, filters)
+    plus the name of the derived frame or chart aggregate, so a rerun caused
+    by an unrelated widget finds everything already computed. The least
+    recently used entries are evicted beyond `max_entries` or `max_bytes`.
+    Cached values are shared between sessions and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=DERIVED_CACHE_MAX_BYTES, max_entries=DERIVED_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+        Return the value cached for `key`, calling `build()` on a miss.
+
+        A `None` key bypasses the cache.
+        """
+        if key is None:
+            return build()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Build outside the lock so other sessions are not held up
+        value = build()
+        nbytes = memory_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            self._evict()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while len(self._entries) > 1 and (self._nbytes > self.max_bytes or len(self._entries) > self.max_entries):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= nbytes
+
+
+@st.cache_resource
+def get_derived_cache():
+    """
+    Return the derived-frame cache shared by every session of this server process.
+    """
+    return DerivedCache()
@@ -0,0 +1,382 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+import streamlit as st
+
+from data_loader import INVOICE_COLUMNS, clean_invoices, get_supabase_client
+from rollups import ROLLUP_KEYS, ROLLUP_MEASURES
+
+# Where the dashboard's filters and grouping are evaluated:
+#   memory   - download the whole table and filter in pandas (default)
+#   supabase - call the invoice_rollup / invoice_filter_options RPC functions
+#              from supabase_schema.sql so only aggregates come back
+#   sqlite   - run the same queries against a local invoices.db (offline testing)
+#   duckdb   - run them as columnar queries over the store built by columnar.py
+QUERY_MODE = os.getenv("INVOICE_QUERY_MODE", "memory")
+QUERY_SQLITE_PATH = os.getenv("INVOICE_QUERY_SQLITE_PATH", "invoices.db")
+
+# Invoice lines returned by `lines()` when no page size is given
+QUERY_LINE_LIMIT = int(os.getenv("INVOICE_QUERY_LINE_LIMIT", "200"))
+
+# Period each rollup row is truncated to on the server
+GRAINS = ('day', 'week', 'month')
+
+# Line columns the paged tables can be sorted by. The Supabase and SQLite
+# tables keep the typed date and weight in their own columns.
+SORT_COLUMNS = ('id', 'date', 'customer_name', 'material', 'material_form', 'total_weight_value', 'amount')
+_STORED_SORT_COLUMNS = {'date': 'invoice_date', 'total_weight_value': 'total_weight_lbs'}
+
+
+def _sort_column(sort, stored=None):
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort lines by {sort!r}; expected one of {SORT_COLUMNS}")
+    return (stored or {}).get(sort, sort)
+
+
+def make_filters(date_range=None, material=None, customer=None):
+    """
+    Build the filter dict shared by the query backends; 'All' and empty values mean no filter.
+    """
+    start, end = (date_range if date_range is not None and len(date_range) == 2 else (None, None))
+    return {
+        'start_date': start.isoformat() if start is not None else None,
+        'end_date': end.isoformat() if end is not None else None,
+        'material': material if material not in (None, 'All') else None,
+        'customer': customer if customer not in (None, 'All') else None,
+    }
+
+
+def grain_for(agg_level):
+    """
+    Coarsest server-side grain the charts can be built from. Weekly charts
+    still need days, because the monthly heatmap cuts across weeks.
+    """
+    return 'month' if agg_level == "Monthly" else 'day'
+
+
+def filter_options(df):
+    """
+    Date bounds and choices for the sidebar filters, from an in-memory invoices frame.
+    """
+    valid_dates = df['date'].dropna()
+    return {
+        'min_date': valid_dates.min() if len(valid_dates) > 0 else None,
+        'max_date': valid_dates.max() if len(valid_dates) > 0 else None,
+        'materials': sorted(df['material'].dropna().unique().tolist()),
+        'customers': sorted(df['customer_name'].unique().tolist()),
+        'material_forms': sorted(df['material_form'].dropna().unique()),
+    }
+
+
+def rollup_frame(records):
+    """
+    Turn rollup records (or a result frame) from a backend into the frame layout of rollups.build_daily_rollup.
+    """
+    rollup = pd.DataFrame(records, columns=ROLLUP_KEYS + ROLLUP_MEASURES)
+    rollup['day'] = pd.to_datetime(rollup['day'])
+    for col in ROLLUP_KEYS[1:]:
+        # DuckDB returns ENUM columns as categoricals
+        if isinstance(rollup[col].dtype, pd.CategoricalDtype):
+            rollup[col] = rollup[col].astype(object)
+    for col in ROLLUP_MEASURES:
+        rollup[col] = pd.to_numeric(rollup[col]).fillna(0)
+    return rollup
+
+
+def _options_from_record(record):
+    return {
+        'min_date': pd.Timestamp(record['min_date']) if record.get('min_date') else None,
+        'max_date': pd.Timestamp(record['max_date']) if record.get('max_date') else None,
+        'materials': sorted(record.get('materials') or []),
+        'customers': sorted(record.get('customers') or []),
+        'material_forms': sorted(record.get('material_forms') or []),
+    }
+
+
+class _PayloadMeter:
+    """
+    Track the JSON payload size of the last call, per thread: the backend is
+    shared by all sessions and Streamlit runs each session in its own thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def last_payload_bytes(self):
+        return getattr(self._local, 'payload_bytes', 0)
+
+    def _record_payload(self, data):
+        # Size of the JSON the server sent (or would send) for the results
+        if isinstance(data, pd.DataFrame):
+            self._local.payload_bytes = len(data.to_json(orient='records', date_format='iso').encode())
+        else:
+            self._local.payload_bytes = len(json.dumps(data, default=str).encode())
+
+
+class SupabaseQuery(_PayloadMeter):
+    """
+    Push filters and grouping down to Postgres through the RPC functions
+    defined in supabase_schema.sql.
+    """
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def filter_options(self):
+        data = self.client.rpc('invoice_filter_options', {}).execute().data
+        self._record_payload(data)
+        # Scalar json results come back as the object itself, set-returning ones as a list
+        return _options_from_record(data[0] if isinstance(data, list) else data)
+
+    def rollup(self, filters, grain='day'):
+        params = {
+            'start_date': filters.get('start_date'),
+            'end_date': filters.get('end_date'),
+            'material_filter': filters.get('material'),
+            'customer_filter': filters.get('customer'),
+            'grain': grain,
+        }
+        data = self.client.rpc('invoice_rollup', params).execute().data
+        self._record_payload(data)
+        return rollup_frame(data)
+
+    def _filtered(self, query, filters):
+        query = query.not_.is_('total_weight', 'null').neq('total_weight', '')
+        if filters.get('start_date'):
+            query = query.gte('invoice_date', filters['start_date'])
+        if filters.get('end_date'):
+            query = query.lte('invoice_date', filters['end_date'])
+        if filters.get('material'):
+            query = query.eq('material', filters['material'])
+        if filters.get('customer'):
+            query = query.eq('customer_name', filters['customer'])
+        return query
+
+    def lines(self, filters, limit=QUERY_LINE_LIMIT, columns=INVOICE_COLUMNS, offset=0, sort='id', descending=False):
+        query = self._filtered(self.client.table('invoices').select(','.join(columns)), filters)
+        query = query.order(_sort_column(sort, _STORED_SORT_COLUMNS), desc=descending)
+        if sort != 'id':
+            # Ties keep id order so pages do not overlap
+            query = query.order('id')
+        # offset/limit rather than range(), as in data_loader.fetch_invoices
+        data = query.offset(offset).limit(limit).execute().data
+        self._record_payload(data)
+        return clean_invoices(pd.DataFrame(data, columns=list(columns)))
+
+    def count_lines(self, filters):
+        # Only the count header comes back; the filters use the indexed columns
+        response = self._filtered(self.client.table('invoices').select('id', count='exact'), filters).limit(1).execute()
+        return response.count or 0
+
+
+# Rollup rows of invoices.db truncated to a grain (see GRAINS)
+_SQLITE_GRAIN_EXPRESSIONS = {
+    'day': 'day',
+    'week': "date(day, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m-01', day)",
+}
+
+
+class SQLiteQuery(_PayloadMeter):
+    """
+    Local stand-in for SupabaseQuery that answers the same calls from the
+    invoices and invoice_daily_rollup tables of an invoices.db.
+    """
+
+    def __init__(self, db_path=QUERY_SQLITE_PATH):
+        super().__init__()
+        self.db_path = db_path
+
+    def _query(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.row_factory = sqlite3.Row
+            records = [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+        return records
+
+    @staticmethod
+    def _where(filters, date_column):
+        clauses = []
+        params = []
+        for key, clause in (
+            ('start_date', f'{date_column} >= ?'),
+            ('end_date', f'{date_column} <= ?'),
+            ('material', 'material = ?'),
+            ('customer', 'customer_name = ?'),
+        ):
+            if filters.get(key):
+                clauses.append(clause)
+                params.append(filters[key])
+        return (' AND '.join(clauses) or '1'), params
+
+    def filter_options(self):
+        bounds = self._query('SELECT MIN(day) AS min_date, MAX(day) AS max_date FROM invoice_daily_rollup')[0]
+        record = dict(bounds)
+        for key, col in (('materials', 'material'), ('customers', 'customer_name'), ('material_forms', 'material_form')):
+            record[key] = [row[col] for row in self._query(
+                f'SELECT DISTINCT {col} FROM invoice_daily_rollup WHERE {col} IS NOT NULL')]
+        self._record_payload(record)
+        return _options_from_record(record)
+
+    def rollup(self, filters, grain='day'):
+        period = _SQLITE_GRAIN_EXPRESSIONS[grain]
+        where, params = self._where(filters, 'day')
+        measures = ', '.join(f'SUM({col}) AS {col}' for col in ROLLUP_MEASURES)
+        records = self._query(f'''
+            SELECT {period} AS day, customer_name, material, material_form, {measures}
+            FROM invoice_daily_rollup
+            WHERE {where}
+            GROUP BY 1, customer_name, material, material_form
+        ''', params)
+        self._record_payload(records)
+        return rollup_frame(records)
+
+    def lines(self, filters, limit=QUERY_LINE_LIMIT, columns=INVOICE_COLUMNS, offset=0, sort='id', descending=False):
+        where, params = self._where(filters, 'invoice_date')
+        order = f"{_sort_column(sort, _STORED_SORT_COLUMNS)} {'DESC' if descending else 'ASC'} NULLS LAST"
+        records = self._query(f'''
+            SELECT {', '.join(columns)} FROM invoices
+            WHERE total_weight IS NOT NULL AND total_weight != '' AND {where}
+            ORDER BY {order}, id LIMIT ? OFFSET ?
+        ''', params + [limit, offset])
+        self._record_payload(records)
+        return clean_invoices(pd.DataFrame(records, columns=list(columns)))
+
+    def count_lines(self, filters):
+        where, params = self._where(filters, 'invoice_date')
+        return self._query(f'''
+            SELECT COUNT(*) AS lines FROM invoices
+            WHERE total_weight IS NOT NULL AND total_weight != '' AND {where}
+        ''', params)[0]['lines']
+
+
+class DuckDBQuery(_PayloadMeter):
+    """
+    Answer the SupabaseQuery calls with DuckDB over the columnar store of
+    cleaned invoice lines (a DuckDB file or a Parquet snapshot, see columnar.py).
+
+    The store is reopened when the file is replaced by a rebuild.
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        from columnar import COLUMNAR_PATH, COLUMNAR_TABLE, import_duckdb
+
+        self.duckdb = import_duckdb()
+        self.path = path or COLUMNAR_PATH
+        self.table = COLUMNAR_TABLE
+        self._conn = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _cursor(self):
+        # One connection per store file; each call gets its own cursor so sessions can query concurrently
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._conn is None or mtime != self._mtime:
+                if self._conn is not None:
+                    self._conn.close()
+                if self.path.endswith('.parquet'):
+                    conn = self.duckdb.connect()
+                    conn.execute(f"CREATE VIEW {self.table} AS SELECT * FROM read_parquet('{self.path}')")
+                else:
+                    conn = self.duckdb.connect(self.path, read_only=True)
+                conn.execute('SET enable_progress_bar = false')
+                self._conn, self._mtime = conn, mtime
+            return self._conn.cursor()
+
+    @staticmethod
+    def _where(filters):
+        clauses = []
+        params = []
+        for key, clause in (
+            ('start_date', 'day >= CAST(? AS DATE)'),
+            ('end_date', 'day <= CAST(? AS DATE)'),
+            ('material', 'material = ?'),
+            ('customer', 'customer_name = ?'),
+        ):
+            if filters.get(key):
+                clauses.append(clause)
+                params.append(filters[key])
+        return (' AND '.join(clauses) or 'TRUE'), params
+
+    def _frame(self, sql, params=()):
+        cursor = self._cursor()
+        try:
+            return cursor.execute(sql, params).df()
+        finally:
+            cursor.close()
+
+    def filter_options(self):
+        bounds = self._frame(f'SELECT MIN(date) AS min_date, MAX(date) AS max_date FROM {self.table}')
+        record = {
+            'min_date': bounds['min_date'].iloc[0] if bounds['min_date'].notna().iloc[0] else None,
+            'max_date': bounds['max_date'].iloc[0] if bounds['max_date'].notna().iloc[0] else None,
+        }
+        for key, col in (('materials', 'material'), ('customers', 'customer_name'), ('material_forms', 'material_form')):
+            record[key] = self._frame(
+                f'SELECT DISTINCT {col} FROM {self.table} WHERE {col} IS NOT NULL'
+            )[col].tolist()
+        self._record_payload(record)
+        return _options_from_record(record)
+
+    def rollup(self, filters, grain='day'):
+        # Same measures as rollups.build_daily_rollup, straight from the lines
+        if grain not in GRAINS:
+            raise ValueError(f"Unknown grain {grain!r}; expected one of {GRAINS}")
+        where, params = self._where(filters)
+        rollup = self._frame(f'''
+            SELECT
+                CAST(date_trunc('{grain}', day) AS DATE) AS day,
+                customer_name,
+                material,
+                material_form,
+                SUM(COALESCE(total_weight_value, 0)) AS total_weight,
+                SUM(amount) AS amount,
+                COUNT(material) AS order_count,
+                COUNT(*) AS line_count,
+                COUNT(*) FILTER (WHERE amount <> 0) AS margin_lines,
+                SUM(CASE WHEN amount <> 0 THEN COALESCE(total_weight_value, 0) / -amount ELSE 0 END) AS weight_per_revenue
+            FROM {self.table}
+            WHERE {where}
+            GROUP BY ALL
+        ''', params)
+        self._record_payload(rollup)
+        return rollup_frame(rollup)
+
+    def lines(self, filters, limit=QUERY_LINE_LIMIT, columns=None, offset=0, sort='id', descending=False):
+        where, params = self._where(filters)
+        order = f"{_sort_column(sort)} {'DESC' if descending else 'ASC'} NULLS LAST"
+        lines = self._frame(f'SELECT * EXCLUDE (day) FROM {self.table} WHERE {where} '
+                            f'ORDER BY {order}, id LIMIT ? OFFSET ?', params + [limit, offset])
+        for col in lines.select_dtypes('category'):
+            lines[col] = lines[col].astype(object).where(lines[col].notna(), None)
+        self._record_payload(lines)
+        return lines
+
+    def count_lines(self, filters):
+        where, params = self._where(filters)
+        return int(self._frame(f'SELECT COUNT(*) AS lines FROM {self.table} WHERE {where}', params)['lines'].iloc[0])
+
+
+@st.cache_resource
+def get_query_backend(mode=QUERY_MODE):
+    """
+    Query backend for INVOICE_QUERY_MODE, or None for the in-memory path.
+    """
+    if mode == 'supabase':
+        return SupabaseQuery(get_supabase_client())
+    if mode == 'sqlite':
+        return SQLiteQuery()
+    if mode == 'duckdb':
+        return DuckDBQuery()
+    if mode != 'memory':
+        raise ValueError(f"Unknown INVOICE_QUERY_MODE {mode!r}; expected memory, supabase, sqlite or duckdb")
+    return None
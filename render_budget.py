@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+# Render budget for the line and heatmap charts:
+#   CHART_MAX_SERIES - clients drawn one by one; the rest are summed into "Other"
+#   CHART_MAX_POINTS - points kept per line after LTTB downsampling
+#   CHART_WEBGL_POINTS - points in a chart above which lines are drawn with WebGL (Scattergl)
+CHART_MAX_SERIES = int(os.getenv("INVOICE_CHART_MAX_SERIES", "15"))
+CHART_MAX_POINTS = int(os.getenv("INVOICE_CHART_MAX_POINTS", "1000"))
+CHART_WEBGL_POINTS = int(os.getenv("INVOICE_CHART_WEBGL_POINTS", "5000"))
+
+OTHER_LABEL = 'Other'
+
+
+def top_series(frame, series, value, keys, max_series=CHART_MAX_SERIES, other=OTHER_LABEL):
+    """
+    Keep the `max_series` values of `series` with the largest total `value`
+    and sum the rest into one `other` series per `keys`.
+
+    Returns the frame itself when it has no more than `max_series` series.
+    """
+    totals = frame.groupby(series, observed=True)[value].sum()
+    if len(totals) <= max_series:
+        return frame
+    kept = frame[series].isin(totals.nlargest(max_series).index)
+    rest = frame[~kept].groupby(keys, sort=False, dropna=False, observed=True)[value].sum().reset_index()
+    rest[series] = other
+    return pd.concat([frame[kept], rest[frame.columns]], ignore_index=True)
+
+
+def lttb_indices(x, y, max_points=CHART_MAX_POINTS):
+    """
+    Positions of the points Largest-Triangle-Three-Buckets keeps to draw the
+    line through (x, y), x sorted, with at most `max_points` points.
+
+    The first and last points are always kept; in between, each bucket keeps
+    the point forming the largest triangle with the previous kept point and
+    the average of the next bucket, which preserves peaks and troughs.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    # Missing or infinite values cannot be weighed; they count as zero when choosing
+    y = np.nan_to_num(np.asarray(y, dtype='float64'), nan=0.0, posinf=0.0, neginf=0.0)
+
+    edges = (np.arange(max_points - 1) * (n - 2) / (max_points - 2)).astype(np.intp) + 1
+    edges[-1] = n - 1
+    kept = np.empty(max_points, dtype=np.intp)
+    kept[0] = 0
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    kept[-1] = n - 1
+    return kept
+
+
+def downsample(frame, x, y, series=None, max_points=CHART_MAX_POINTS):
+    """
+    Rows of `frame` kept when each line (one per value of `series`) is
+    downsampled with LTTB to `max_points` points, in their original order.
+
+    `x` may hold dates or period labels; points are spaced by their rank.
+    """
+    ranks = pd.factorize(frame[x], sort=True)[0]
+    values = frame[y].to_numpy()
+    groups = frame.groupby(series, sort=False, dropna=False, observed=True).indices.values() if series else [np.arange(len(frame))]
+    kept = []
+    for positions in groups:
+        if len(positions) <= max_points:
+            kept.append(positions)
+            continue
+        positions = positions[np.argsort(ranks[positions], kind='stable')]
+        kept.append(positions[lttb_indices(ranks[positions], values[positions], max_points)])
+    if sum(len(positions) for positions in kept) == len(frame):
+        return frame
+    return frame.iloc[np.sort(np.concatenate(kept))]
+
+
+def scatter_trace(points, webgl_points=CHART_WEBGL_POINTS):
+    """
+    Trace class for a chart drawing `points` points: Scattergl above the WebGL threshold.
+    """
+    import plotly.graph_objects as go
+
+    return go.Scattergl if points > webgl_points else go.Scatter
+
+
+def figure_payload_bytes(fig):
+    """
+    Size of the JSON Streamlit sends to the browser for `fig`.
+    """
+    return len(pio.to_json(fig, validate=False))
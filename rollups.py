@@ -0,0 +1,169 @@
+from contextlib import nullcontext
+
+import pandas as pd
+
+from compact import concat_compact
+
+# Grain of the daily rollup; every sidebar filter is one of these columns
+ROLLUP_KEYS = ['day', 'customer_name', 'material', 'material_form']
+
+# Additive measures kept per rollup row
+ROLLUP_MEASURES = ['total_weight', 'amount', 'order_count', 'line_count', 'margin_lines', 'weight_per_revenue']
+
+
+def build_daily_rollup(df):
+    """
+    Sum a cleaned invoices frame to one row per day x customer x material x form.
+
+    Profit depends on the per-session cost table, so instead of profit the
+    rollup keeps `weight_per_revenue`, the sum of total weight / revenue per
+    line. With it the mean line margin can be rebuilt for any cost per lb:
+    margin = 100 - 100 * cost * weight / revenue. Lines without revenue have
+    no margin and are left out of `margin_lines`.
+    """
+    has_revenue = df['amount'].notna() & (df['amount'] != 0)
+    lines = pd.DataFrame({
+        'day': df['date'].dt.normalize(),
+        'customer_name': df['customer_name'],
+        'material': df['material'],
+        'material_form': df['material_form'],
+        'total_weight': df['total_weight_value'],
+        'amount': df['amount'],
+        'order_count': df['material'].notna().astype('int64'),
+        'line_count': 1,
+        'margin_lines': has_revenue.astype('int64'),
+        'weight_per_revenue': (df['total_weight_value'] / -df['amount']).where(has_revenue, 0.0),
+    })
+    return lines.groupby(ROLLUP_KEYS, dropna=False, sort=False, observed=True).sum().reset_index()
+
+
+def update_daily_rollup(rollup, df, days):
+    """
+    Rebuild the rollup rows for `days` from `df`, keeping every other day as it is.
+    """
+    days = pd.DatetimeIndex(days).normalize()
+    kept = rollup[~rollup['day'].isin(days)]
+    touched = df[df['date'].dt.normalize().isin(days)]
+    return concat_compact([kept, build_daily_rollup(touched)])
+
+
+def period_key(days, agg_level):
+    """
+    Period label for the Daily / Weekly / Monthly time aggregation.
+
+    Labels are built once per distinct date and broadcast back, since a
+    history has far fewer distinct dates than lines.
+    """
+    codes, uniques = pd.factorize(days, use_na_sentinel=False)
+    labels = _period_labels(pd.Series(uniques), agg_level).to_numpy(dtype=object)
+    return pd.Series(labels[codes], index=days.index, name=days.name)
+
+
+def _period_labels(days, agg_level):
+    if agg_level == "Daily":
+        return days.dt.date
+    elif agg_level == "Weekly":
+        return days.dt.to_period('W').astype(str)
+    else:  # Monthly
+        return days.dt.to_period('M').astype(str)
+
+
+def add_profit(rollup, material_costs):
+    """
+    Add cost and profit measures to rollup rows for the session's cost per lb table.
+
+    Rows whose material form has no cost get NaN cost and profit, and do not
+    count towards the margin, like the line-level calculation.
+    """
+    cost_per_lb = rollup['material_form'].map(material_costs).astype('float64')
+    has_cost = cost_per_lb.notna()
+    total_cost = rollup['total_weight'] * cost_per_lb
+    margin_lines = rollup['margin_lines'].where(has_cost, 0)
+    return rollup.assign(
+        cost_per_lb=cost_per_lb,
+        total_cost=total_cost,
+        profit=-rollup['amount'] - total_cost,  # Negative amount because income is stored as negative
+        profit_lines=rollup['line_count'].where(has_cost, 0),
+        margin_lines=margin_lines,
+        margin_sum=(100 * margin_lines - 100 * cost_per_lb * rollup['weight_per_revenue']).where(has_cost, 0.0),
+    )
+
+
+def summarize(rollup, by):
+    """
+    Group rollup rows by `by` and derive the per-line averages used by the charts.
+    """
+    grouped = rollup.groupby(by, sort=True, observed=True).sum(numeric_only=True).reset_index()
+    return finish_summary(grouped)
+
+
+def finish_summary(sums):
+    """
+    Derive averages from summed measures (works on a grouped frame or a single row).
+    """
+    sums = sums.copy()
+    lines = sums['line_count'].where(sums['line_count'] != 0)
+    sums['avg_order_size'] = sums['total_weight'] / lines
+    sums['avg_order_value'] = -sums['amount'] / lines
+    if 'profit' in sums:
+        sums['margin'] = sums['margin_sum'] / sums['margin_lines'].where(sums['margin_lines'] != 0)
+        sums['profit_per_order'] = sums['profit'] / sums['profit_lines'].where(sums['profit_lines'] != 0)
+    return sums
+
+
+# SQL that rebuilds the rollup rows of the given days inside invoices.db
+_SQLITE_ROLLUP_SELECT = '''
+    SELECT
+        invoice_date AS day,
+        customer_name,
+        material,
+        material_form,
+        SUM(COALESCE(total_weight_lbs, 0)) AS total_weight,
+        SUM(amount) AS amount,
+        SUM(material IS NOT NULL) AS order_count,
+        COUNT(*) AS line_count,
+        SUM(amount IS NOT NULL AND amount != 0) AS margin_lines,
+        SUM(CASE WHEN amount != 0 THEN COALESCE(total_weight_lbs, 0) / -amount ELSE 0 END) AS weight_per_revenue
+    FROM invoices
+    WHERE invoice_date IN ({placeholders})
+      AND total_weight IS NOT NULL AND total_weight != ''
+    GROUP BY invoice_date, customer_name, material, material_form
+'''
+
+
+def ensure_sqlite_rollup(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_daily_rollup (
+            day DATE,
+            customer_name TEXT,
+            material TEXT,
+            material_form TEXT,
+            total_weight REAL,
+            amount REAL,
+            order_count INTEGER,
+            line_count INTEGER,
+            margin_lines INTEGER,
+            weight_per_revenue REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS invoice_daily_rollup_day_idx ON invoice_daily_rollup (day)')
+    conn.execute('CREATE INDEX IF NOT EXISTS invoices_invoice_date_idx ON invoices (invoice_date)')
+
+
+def refresh_sqlite_rollup(conn, days, batch_size=500, commit=True):
+    """
+    Recompute the invoice_daily_rollup rows of `days` (YYYY-MM-DD strings) from the invoices table.
+
+    With `commit=False` the changes join the caller's open transaction.
+    """
+    ensure_sqlite_rollup(conn)
+    days = sorted({day for day in days if isinstance(day, str)})
+    with conn if commit else nullcontext():
+        for start in range(0, len(days), batch_size):
+            batch = days[start:start + batch_size]
+            placeholders = ', '.join('?' for _ in batch)
+            conn.execute(f'DELETE FROM invoice_daily_rollup WHERE day IN ({placeholders})', batch)
+            conn.execute(
+                f'INSERT INTO invoice_daily_rollup {_SQLITE_ROLLUP_SELECT.format(placeholders=placeholders)}',
+                batch
+            )
@@ -0,0 +1,98 @@
+import bisect
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Invoice fields covered by the Raw Data search box
+SEARCH_COLUMNS = ('customer_name', 'memo', 'item_description', 'document_number')
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Lower-cased words of `text`; punctuation and spaces separate words.
+    """
+    return _WORD.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Inverted word index over the searchable invoice fields.
+
+    The fields repeat heavily (one customer or product description on many
+    lines), so each field is factorized and only its distinct values are
+    tokenized. A sorted vocabulary maps every word to the distinct values
+    containing it; a query resolves to distinct values first and then to
+    rows with one vectorized lookup per field.
+
+    Every query word must match the start of a word in one of the fields
+    ("acm inv-10" finds "Acme Corp" lines on document "INV-1042").
+    """
+
+    def __init__(self, df, columns=SEARCH_COLUMNS):
+        self.rows = len(df)
+        self.columns = [col for col in columns if col in df.columns]
+        self._codes = {}
+        words, owners, value_ids = [], [], []
+        for position, col in enumerate(self.columns):
+            codes, uniques = pd.factorize(df[col])
+            # Missing values (code -1) look up the extra False slot at the end
+            codes = np.where(codes < 0, len(uniques), codes).astype(np.int32)
+            self._codes[col] = (codes, len(uniques))
+            for value_id, value in enumerate(uniques):
+                for word in set(tokenize(str(value))):
+                    words.append(word)
+                    owners.append(position)
+                    value_ids.append(value_id)
+
+        # Sorted vocabulary; for each field, the ids of the distinct values
+        # containing each word are stored contiguously in vocabulary order, so
+        # all words sharing a prefix map to one slice
+        vocabulary, word_ids = np.unique(np.array(words, dtype=object), return_inverse=True)
+        self._words = vocabulary.tolist()
+        owners = np.array(owners, dtype=np.intp)
+        value_ids = np.array(value_ids, dtype=np.intp)
+        self._postings = {}
+        for position, col in enumerate(self.columns):
+            owned = owners == position
+            order = np.argsort(word_ids[owned], kind='stable')
+            offsets = np.searchsorted(word_ids[owned][order], np.arange(len(self._words) + 1))
+            self._postings[col] = (value_ids[owned][order], offsets)
+
+    @property
+    def nbytes(self):
+        # Arrays plus the vocabulary, for the invoice cache's memory budget
+        arrays = sum(codes.nbytes for codes, _ in self._codes.values()) + sum(
+            value_ids.nbytes + offsets.nbytes for value_ids, offsets in self._postings.values()
+        )
+        return arrays + sys.getsizeof(self._words) + sum(sys.getsizeof(word) for word in self._words)
+
+    def _word_mask(self, prefix):
+        # Rows where some field has a word starting with `prefix`
+        start = bisect.bisect_left(self._words, prefix)
+        end = bisect.bisect_left(self._words, prefix + '\uffff', lo=start)
+        mask = np.zeros(self.rows, dtype=bool)
+        for col in self.columns:
+            value_ids, offsets = self._postings[col]
+            matched = value_ids[offsets[start]:offsets[end]]
+            if len(matched):
+                codes, size = self._codes[col]
+                lookup = np.zeros(size + 1, dtype=bool)
+                lookup[matched] = True
+                mask |= lookup[codes]
+        return mask
+
+    def search(self, query):
+        """
+        Boolean row mask of the lines matching every word of `query`.
+        """
+        words = tokenize(query)
+        mask = np.ones(self.rows, dtype=bool)
+        for word in words:
+            mask &= self._word_mask(word)
+            if not mask.any():
+                break
+        return mask
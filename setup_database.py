@@ -1,35 +1,56 @@
 import sqlite3
 
-# Connect to SQLite database (or create it if it doesn't exist)
-conn = sqlite3.connect('invoices.db')
-cursor = conn.cursor()
-
-# Drop existing table if it exists
-cursor.execute('DROP TABLE IF EXISTS invoices')
-
-# Create the invoices table with new columns
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS invoices (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    type TEXT,
-    date TEXT,
-    document_number TEXT,
-    customer_name TEXT,
-    memo TEXT,
-    account TEXT,
-    quantity REAL,
-    amount REAL,
-    item_description TEXT,
-    item_type TEXT,
-    material TEXT,
-    material_form TEXT,
-    weight TEXT,
-    total_weight TEXT
-)
-''')
-
-# Commit changes and close the connection
-conn.commit()
-conn.close()
-
-print("Database and table created successfully with updated schema.")
+from rollups import ensure_sqlite_rollup
+
+
+def create_database(db_path='invoices.db'):
+    """
+    Create (or recreate, dropping existing data) the invoices database at `db_path`.
+    """
+    # Connect to SQLite database (or create it if it doesn't exist)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Drop existing tables if they exist
+    cursor.execute('DROP TABLE IF EXISTS invoices')
+    cursor.execute('DROP TABLE IF EXISTS invoice_daily_rollup')
+
+    # Create the invoices table with new columns
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT,
+        date TEXT,
+        document_number TEXT,
+        customer_name TEXT,
+        memo TEXT,
+        account TEXT,
+        quantity REAL,
+        amount REAL,
+        item_description TEXT,
+        item_type TEXT,
+        material TEXT,
+        material_form TEXT,
+        weight TEXT,
+        total_weight TEXT,
+        weight_lbs REAL,
+        total_weight_lbs REAL,
+        invoice_date DATE
+    )
+    ''')
+
+    # Daily customer x material x form rollup, refreshed by migrate_data.py
+    ensure_sqlite_rollup(conn)
+
+    # Record the schema version so update_database.py knows the typed columns exist
+    cursor.execute('PRAGMA user_version = 2')
+
+    # Commit changes and close the connection
+    conn.commit()
+    conn.close()
+
+    print("Database and table created successfully with updated schema.")
+
+
+if __name__ == "__main__":
+    create_database()
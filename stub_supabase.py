@@ -0,0 +1,120 @@
+import argparse
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Rows received per table, shared by all request threads
+TABLES = {}
+# Position of each upserted row by (table, on_conflict key values)
+KEYS = {}
+LOCK = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the Supabase REST endpoint used by migrate_to_supabase.py.
+
+    POST /rest/v1/<table> appends the JSON records (or merges them on the
+    `on_conflict` columns when sent with `Prefer: resolution=merge-duplicates`),
+    GET /rest/v1/<table> returns them, one page at a time when asked. A fraction of requests can be failed with 429 or 503 to
+    exercise the uploader's retries.
+    """
+
+    fail_rate = 0.0
+    rate_limit_rate = 0.0
+
+    def _table(self):
+        path = urlparse(self.path).path
+        if not path.startswith('/rest/v1/'):
+            return None
+        return path[len('/rest/v1/'):]
+
+    def _reply(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        table = self._table()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if table is None:
+            return self._reply(404, {'message': 'not found'})
+
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return self._reply(429, {'message': 'rate limited'}, {'Retry-After': '1'})
+        if roll < self.rate_limit_rate + self.fail_rate:
+            return self._reply(503, {'message': 'unavailable'})
+
+        records = json.loads(body)
+        if isinstance(records, dict):
+            records = [records]
+        on_conflict = parse_qs(urlparse(self.path).query).get('on_conflict', [''])[0]
+        merge = on_conflict and 'merge-duplicates' in self.headers.get('Prefer', '')
+        with LOCK:
+            rows = TABLES.setdefault(table, [])
+            for record in records:
+                if not merge:
+                    rows.append(record)
+                    continue
+                key = (table,) + tuple(record.get(column) for column in on_conflict.split(','))
+                if key in KEYS:
+                    rows[KEYS[key]] = record
+                else:
+                    KEYS[key] = len(rows)
+                    rows.append(record)
+        return self._reply(201)
+
+    def do_GET(self):
+        table = self._table()
+        # The client sends a body with GETs too; leaving it unread resets the connection
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if table is None:
+            return self._reply(404, {'message': 'not found'})
+        with LOCK:
+            rows = list(TABLES.get(table, []))
+        # Pages are asked for with offset/limit parameters (data_loader.fetch_invoices)
+        # or a "Range: <first>-<last>" header
+        query = parse_qs(urlparse(self.path).query)
+        first = int(query.get('offset', ['0'])[0])
+        last = first + int(query['limit'][0]) - 1 if 'limit' in query else len(rows) - 1
+        requested = self.headers.get('Range')
+        if requested:
+            start, _, end = requested.partition('-')
+            first, last = int(start), int(end) if end else last
+        page = rows[first:last + 1]
+        return self._reply(200, page, {'Content-Range': f'{first}-{max(first + len(page) - 1, first)}/{len(rows)}'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Supabase REST API")
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of POSTs answered with 503")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of POSTs answered with 429")
+    args = parser.parse_args()
+
+    StubHandler.fail_rate = args.fail_rate
+    StubHandler.rate_limit_rate = args.rate_limit_rate
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StubHandler)
+    print(f"Stub Supabase listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for table, rows in TABLES.items():
+            print(f"{table}: {len(rows)} rows received")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+-- Typed invoice columns (schema version 2), upsert key and query-mode functions
+--
+-- Run in the Supabase SQL editor before deploying a dashboard that reads
+-- weight_lbs / total_weight_lbs / invoice_date. Safe to run more than once.
+
+alter table invoices add column if not exists weight_lbs double precision;
+alter table invoices add column if not exists total_weight_lbs double precision;
+alter table invoices add column if not exists invoice_date date;
+
+-- Backfill from the text columns: "500 lbs" strings and Excel serial or ISO dates
+update invoices
+set
+    weight_lbs = case
+        when weight ~ '^\s*-?[0-9]+(\.[0-9]+)?( lbs)?\s*$'
+        then replace(weight, ' lbs', '')::double precision
+    end,
+    total_weight_lbs = case
+        when total_weight ~ '^\s*-?[0-9]+(\.[0-9]+)?( lbs)?\s*$'
+        then replace(total_weight, ' lbs', '')::double precision
+    end,
+    invoice_date = case
+        when date ~ '^\s*[0-9]+(\.[0-9]+)?\s*$'
+        then date '1899-12-30' + floor(date::numeric)::integer
+        when date ~ '^\d{4}-\d{2}-\d{2}'
+        then substring(date from 1 for 10)::date
+    end
+where invoice_date is null;
+
+create index if not exists invoices_invoice_date_idx on invoices (invoice_date);
+
+-- Natural key for `migrate_to_supabase.py --mode upsert`: document number + line within it
+alter table invoices add column if not exists line_number integer;
+
+-- Number existing lines in id order. The first upsert sync resends every row
+-- and overwrites each (document_number, line_number) with the local values.
+update invoices
+set line_number = numbered.line_number
+from (
+    select id, row_number() over (partition by document_number order by id) as line_number
+    from invoices
+) as numbered
+where invoices.id = numbered.id and invoices.line_number is null;
+
+create unique index if not exists invoices_document_line_key on invoices (document_number, line_number);
+
+-- Aggregation pushdown for INVOICE_QUERY_MODE=supabase (queries.py): the
+-- dashboard sends its filters and gets the customer x material x form rollup
+-- back, truncated to `grain` ('day', 'week' or 'month'), instead of every line.
+-- Same measures as rollups.build_daily_rollup.
+create or replace function invoice_rollup(
+    start_date date default null,
+    end_date date default null,
+    material_filter text default null,
+    customer_filter text default null,
+    grain text default 'day'
+)
+returns table (
+    day date,
+    customer_name text,
+    material text,
+    material_form text,
+    total_weight double precision,
+    amount double precision,
+    order_count bigint,
+    line_count bigint,
+    margin_lines bigint,
+    weight_per_revenue double precision
+)
+language sql stable
+as $$
+    select
+        date_trunc(invoice_rollup.grain, i.invoice_date::timestamp)::date,
+        i.customer_name,
+        i.material,
+        i.material_form,
+        sum(coalesce(i.total_weight_lbs, 0))::double precision,
+        sum(i.amount)::double precision,
+        count(i.material),
+        count(*),
+        count(*) filter (where i.amount <> 0),
+        sum(case when i.amount <> 0 then coalesce(i.total_weight_lbs, 0) / -i.amount else 0 end)::double precision
+    from invoices i
+    where i.total_weight is not null and i.total_weight <> ''
+      and i.invoice_date is not null
+      and (invoice_rollup.start_date is null or i.invoice_date >= invoice_rollup.start_date)
+      and (invoice_rollup.end_date is null or i.invoice_date <= invoice_rollup.end_date)
+      and (material_filter is null or i.material = material_filter)
+      and (customer_filter is null or i.customer_name = customer_filter)
+    group by 1, 2, 3, 4
+$$;
+
+-- Date bounds and distinct values for the sidebar filters in query mode
+create or replace function invoice_filter_options()
+returns json
+language sql stable
+as $$
+    select json_build_object(
+        'min_date', min(invoice_date),
+        'max_date', max(invoice_date),
+        'materials', coalesce(json_agg(distinct material) filter (where material is not null), '[]'),
+        'customers', coalesce(json_agg(distinct customer_name) filter (where customer_name is not null), '[]'),
+        'material_forms', coalesce(json_agg(distinct material_form) filter (where material_form is not null), '[]')
+    )
+    from invoices
+    where total_weight is not null and total_weight <> ''
+$$;
+
+-- Filtered line reads in query mode
+create index if not exists invoices_material_idx on invoices (material);
+create index if not exists invoices_customer_name_idx on invoices (customer_name);
@@ -0,0 +1,192 @@
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from migrate_data import add_material_columns, prepare_rows
+
+# Product lines of the generated item descriptions ("EpiX Powder, 50 lb bag")
+# and the price per lb each one sells at
+PRODUCT_PRICES = {'EpiX': 2.10, 'KinetiX': 1.65, 'DynamiX': 2.80}
+PRODUCT_FORMS = ['Powder', 'Granule', 'Pellet', 'Liquid Concentrate']
+PACKAGES = [(25, 'bag'), (50, 'bag'), (500, 'drum'), (1000, 'tote'), (2000, 'super sack')]
+
+# Lines without a product: description, item type, amount range
+OTHER_ITEMS = [
+    ('Freight', 'Other Charge', (40, 600)),
+    ('Pallet charge', 'Other Charge', (15, 60)),
+    ('Technical consultation', 'Service', (150, 1500)),
+    (None, None, (5, 50)),
+]
+OTHER_SHARE = 0.12
+
+# Header of a QuickBooks sales export; every name keeps its trailing space
+# and the file starts with a byte order mark, like the real exports
+EXPORT_COLUMNS = ['Type ', 'Date ', 'Document Number ', 'Name ', 'Memo ', 'Account ',
+                  'Qty ', 'Amount ', 'Item: Description (Sales) ', 'Item: Item Type ']
+
+# Invoice dates span these Excel serials (2019-01-01 to 2024-12-31)
+FIRST_SERIAL = 43466
+LAST_SERIAL = 45657
+
+# Rows generated and written per step by write_quickbooks_csv()
+CHUNK_ROWS = 1_000_000
+
+_NAME_WORDS = (
+    ['Acme', 'Summit', 'Harbor', 'Prairie', 'Granite', 'Blue Ridge', 'Northern', 'Coastal', 'Valley', 'Pioneer',
+     'Evergreen', 'Redwood', 'Lakeside', 'Ironwood', 'Silver Creek', 'Heartland', 'Canyon', 'Meadow', 'Atlas',
+     'Keystone'],
+    ['Turf', 'Agronomy', 'Landscaping', 'Golf', 'Farms', 'Nursery', 'Grounds', 'Growers', 'Seed', 'Supply',
+     'Irrigation', 'Sports Fields', 'Gardens', 'Co-op', 'Orchards'],
+    ['Inc', 'LLC', 'Co', 'Ltd', 'Group', 'Partners'],
+)
+
+
+def product_descriptions():
+    """
+    Every product description of the catalog, e.g. "KinetiX Granule, 500 lb drum".
+    """
+    return [f"{material} {form}, {size} lb {package}"
+            for material in PRODUCT_PRICES for form in PRODUCT_FORMS for size, package in PACKAGES]
+
+
+def customer_count(rows):
+    """
+    Number of distinct customers in an export of `rows` lines.
+    """
+    return int(min(5000, max(50, rows // 200)))
+
+
+def customer_names(count, seed=42):
+    """
+    `count` distinct, plausible customer names, the same for the same seed.
+    """
+    names = [' '.join(words) for words in itertools.product(*_NAME_WORDS)]
+    np.random.default_rng(seed).shuffle(names)
+    return [names[i % len(names)] + (f' #{i // len(names) + 1}' if i >= len(names) else '') for i in range(count)]
+
+
+def make_quickbooks_export(rows, seed=42, start_row=0, customers=None):
+    """
+    Lines `start_row` to `start_row + rows` of a seeded synthetic QuickBooks sales export.
+
+    Lines come in documents of one to five lines sharing a date and customer.
+    Customers are Zipf-distributed (a few large accounts, a long tail),
+    dates are Excel serials stored as text with some ISO dates mixed in,
+    amounts are negative (income) except on credit memos, and about
+    OTHER_SHARE of the lines carry no product (freight, services, blanks).
+    """
+    rng = np.random.default_rng([seed, start_row])
+    customers = customer_names(customers or customer_count(rows), seed)
+
+    # Documents: first line position, customer, date and type
+    lines_per_document = rng.integers(1, 6, rows + 1)
+    starts = np.concatenate([[0], np.cumsum(lines_per_document)])
+    starts = starts[starts < rows]
+    document = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, rows)))
+    ranks = np.arange(1, len(customers) + 1)
+    weights = 1.0 / ranks ** 1.1
+    document_customer = rng.choice(len(customers), len(starts), p=weights / weights.sum())
+    # Business grows over time: later dates are more likely
+    document_serial = FIRST_SERIAL + ((LAST_SERIAL - FIRST_SERIAL) * rng.random(len(starts)) ** 0.8).astype(np.int64)
+    document_type = rng.choice(np.array(['Invoice', 'Sales Receipt', 'Credit Memo'], dtype=object),
+                               len(starts), p=[0.90, 0.07, 0.03])
+
+    serial = document_serial[document]
+    dates = serial.astype(str).astype(object)
+    iso = rng.random(rows) < 0.1
+    dates[iso] = pd.to_datetime(serial[iso], unit='D', origin='1899-12-30').strftime('%Y-%m-%d').to_numpy(dtype=object)
+
+    # Products: earlier catalog entries sell more often
+    descriptions = np.array(product_descriptions(), dtype=object)
+    product_weights = np.linspace(2.0, 0.2, len(descriptions))
+    product = rng.choice(len(descriptions), rows, p=product_weights / product_weights.sum())
+    sizes = np.array([size for _ in PRODUCT_PRICES for _ in PRODUCT_FORMS for size, _ in PACKAGES])
+    prices = np.array([price for price in PRODUCT_PRICES.values() for _ in PRODUCT_FORMS for _ in PACKAGES])
+    quantity = np.minimum(rng.geometric(0.15, rows), 200)
+    amount = -(quantity * sizes[product] * prices[product] * rng.uniform(0.9, 1.1, rows)).round(2)
+    description = descriptions[product]
+    item_type = np.full(rows, 'Inventory Part', dtype=object)
+
+    other = rng.random(rows) < OTHER_SHARE
+    other_item = rng.integers(0, len(OTHER_ITEMS), rows)
+    for number, (text, kind, (low, high)) in enumerate(OTHER_ITEMS):
+        chosen = other & (other_item == number)
+        description[chosen] = text
+        item_type[chosen] = kind
+        quantity[chosen] = 1
+        amount[chosen] = -rng.uniform(low, high, int(chosen.sum())).round(2)
+
+    credit = document_type[document] == 'Credit Memo'
+    quantity = np.where(credit, -quantity, quantity)
+    amount = np.where(credit, -amount, amount)
+
+    line_number = start_row + np.arange(rows)
+    memo = pd.Series(rng.integers(1000, 99999, rows)).map('PO {}'.format).to_numpy(dtype=object)
+    memo[rng.random(rows) < 0.4] = ''
+    return pd.DataFrame({
+        'Type ': document_type[document],
+        'Date ': dates,
+        'Document Number ': pd.Series(line_number[starts][document] + 1001).map('INV-{}'.format).to_numpy(dtype=object),
+        'Name ': np.array(customers, dtype=object)[document_customer[document]],
+        'Memo ': memo,
+        'Account ': np.where(other, 'Sales:Services and Freight', 'Sales:Product Sales').astype(object),
+        'Qty ': quantity.astype(str).astype(object),
+        'Amount ': pd.Series(amount).map('{:.2f}'.format).to_numpy(dtype=object),
+        'Item: Description (Sales) ': description,
+        'Item: Item Type ': item_type,
+    }, columns=EXPORT_COLUMNS)
+
+
+def write_quickbooks_csv(path, rows, seed=42, chunk_rows=CHUNK_ROWS):
+    """
+    Write a synthetic export of `rows` lines to `path`, `chunk_rows` lines at a time.
+
+    The same seed and chunk size always produce the same file.
+    """
+    customers = customer_count(rows)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        for start in range(0, rows, chunk_rows):
+            chunk = make_quickbooks_export(min(chunk_rows, rows - start), seed, start, customers)
+            chunk.to_csv(file, index=False, header=start == 0)
+    return path
+
+
+def make_invoice_table(rows, seed=42):
+    """
+    The invoices table migrate_data.py builds from a synthetic export of
+    `rows` lines, with ids, as the dashboard fetches it from Supabase.
+    """
+    table = prepare_rows(add_material_columns(make_quickbooks_export(rows, seed)))
+    table.insert(0, 'id', np.arange(1, len(table) + 1))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic QuickBooks exports and invoice tables")
+    parser.add_argument('--rows', type=int, default=100000, help="Lines to generate (10k to 10M)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--csv', help="Write a QuickBooks export CSV, loadable with migrate_data.py")
+    parser.add_argument('--table', help="Write the invoices table as .csv or .parquet")
+    args = parser.parse_args()
+    if not args.csv and not args.table:
+        parser.error("Give --csv and/or --table")
+
+    started = time.perf_counter()
+    if args.csv:
+        write_quickbooks_csv(args.csv, args.rows, args.seed)
+        print(f"Wrote {args.rows:,} export lines to {args.csv}")
+    if args.table:
+        table = make_invoice_table(args.rows, args.seed)
+        if args.table.endswith('.parquet'):
+            table.to_parquet(args.table, index=False)
+        else:
+            table.to_csv(args.table, index=False)
+        print(f"Wrote {len(table):,} invoice rows to {args.table}")
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Per-stage timing of dashboard reruns (INVOICE_TIMING=0 turns it off)
+TIMING_ENABLED = os.getenv("INVOICE_TIMING", "1") != "0"
+# Reruns kept for the performance panel
+TIMING_RERUNS = int(os.getenv("INVOICE_TIMING_RERUNS", "100"))
+# Print one JSON line per rerun (INVOICE_TIMING_LOG=0 keeps them in the panel only)
+TIMING_LOG = os.getenv("INVOICE_TIMING_LOG", "1") != "0"
+
+# The rerun being timed on this thread; Streamlit runs each session's script on its own thread
+_current = threading.local()
+
+
+class _Stage:
+    __slots__ = ('rerun', 'name', 'fields', 'started')
+
+    def __init__(self, rerun, name, fields):
+        self.rerun = rerun
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.rerun.add(self.name, time.perf_counter() - self.started, self.fields)
+        return False
+
+    def note(self, **fields):
+        self.fields.update(fields)
+
+
+class _NoStage:
+    # Returned while timing is off: entering, leaving and noting do nothing
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def note(self, **fields):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class Rerun:
+    """
+    Stage timings of one script run: seconds and call count per stage name,
+    plus the fields noted on it (rows, payload bytes, cache hits, ...).
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds, fields):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {'seconds': 0.0, 'calls': 0}
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        entry.update(fields)
+
+    def record(self):
+        return {
+            'event': 'rerun',
+            'at': round(self.started_at, 3),
+            'user': self.user,
+            'total_s': round(time.perf_counter() - self._started, 6),
+            'stages': {name: dict(entry, seconds=round(entry['seconds'], 6)) for name, entry in self.stages.items()},
+        }
+
+
+class TimingHistory:
+    """
+    The last `max_reruns` rerun records of this server process.
+    """
+
+    def __init__(self, max_reruns=TIMING_RERUNS):
+        self._records = deque(maxlen=max_reruns)
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+
+@st.cache_resource
+def get_timing_history():
+    """
+    Return the rerun timing history shared by every session of this server process.
+    """
+    return TimingHistory()
+
+
+def start_rerun(user=None):
+    """
+    Start timing the script run on this thread (a no-op while timing is off).
+    """
+    _current.rerun = Rerun(user) if TIMING_ENABLED else None
+
+
+def stage(name, **fields):
+    """
+    Context manager timing the stage `name` of the current rerun; call
+    `.note(rows=..., bytes=...)` on it to record sizes. Repeated stages add up.
+    """
+    rerun = getattr(_current, 'rerun', None)
+    if rerun is None:
+        return _NO_STAGE
+    return _Stage(rerun, name, fields)
+
+
+def finish_rerun():
+    """
+    Close the current rerun: keep its record in the history and log it as one JSON line.
+    """
+    rerun = getattr(_current, 'rerun', None)
+    if rerun is None:
+        return None
+    _current.rerun = None
+    record = rerun.record()
+    get_timing_history().append(record)
+    if TIMING_LOG:
+        print(json.dumps(record, default=str))
+    return record
+
+
+def stage_percentiles(records):
+    """
+    Per-stage p50/p95 milliseconds over rerun `records`, slowest p95 first,
+    with the rows and bytes last noted on each stage.
+    """
+    samples = {}
+    for record in records:
+        samples.setdefault('total', []).append((record['total_s'], {}))
+        for name, entry in record['stages'].items():
+            samples.setdefault(name, []).append((entry['seconds'], entry))
+    rows = []
+    for name, values in samples.items():
+        seconds = np.array([value for value, _ in values]) * 1000
+        last = values[-1][1]
+        rows.append({
+            'stage': name,
+            'reruns': len(values),
+            'p50_ms': round(float(np.percentile(seconds, 50)), 2),
+            'p95_ms': round(float(np.percentile(seconds, 95)), 2),
+            'last_rows': last.get('rows'),
+            'last_bytes': last.get('bytes'),
+        })
+    columns = ['stage', 'reruns', 'p50_ms', 'p95_ms', 'last_rows', 'last_bytes']
+    return pd.DataFrame(rows, columns=columns).sort_values('p95_ms', ascending=False, ignore_index=True)
+
+
+def rerun_table(record):
+    """
+    Stages of one rerun record in the order they first ran, with milliseconds,
+    call counts and the fields noted on them.
+    """
+    return pd.DataFrame([
+        dict({'stage': name, 'ms': round(entry['seconds'] * 1000, 2)},
+             **{field: value for field, value in entry.items() if field != 'seconds'})
+        for name, entry in record['stages'].items()
+    ])
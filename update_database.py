@@ -1,16 +1,66 @@
 import sqlite3
 
+import pandas as pd
+
+from normalize import extract_weights, excel_dates_to_datetime
+from rollups import refresh_sqlite_rollup
+
+# Typed columns added in schema version 2
+TYPED_COLUMNS = {
+    'weight_lbs': 'REAL',
+    'total_weight_lbs': 'REAL',
+    'invoice_date': 'DATE',
+}
+
 # Connect to the SQLite database
 conn = sqlite3.connect('invoices.db')
 cursor = conn.cursor()
 
-# Add new columns to the invoices table
-cursor.execute('ALTER TABLE invoices ADD COLUMN product TEXT')
-cursor.execute('ALTER TABLE invoices ADD COLUMN item_weight REAL')
-cursor.execute('ALTER TABLE invoices ADD COLUMN total_weight REAL')
+# Add the typed columns that are not there yet
+existing = {row[1] for row in cursor.execute('PRAGMA table_info(invoices)')}
+for column, column_type in TYPED_COLUMNS.items():
+    if column not in existing:
+        cursor.execute(f'ALTER TABLE invoices ADD COLUMN {column} {column_type}')
+
+# Backfill the typed columns from the text columns of existing rows
+df = pd.read_sql_query(
+    'SELECT id, weight, total_weight, date FROM invoices WHERE invoice_date IS NULL',
+    conn
+)
+if not df.empty:
+    # Keep NULL for missing weights instead of the dashboard's 0 default
+    weight_lbs = extract_weights(df['weight']).where(df['weight'].notna() & (df['weight'] != ''))
+    total_weight_lbs = extract_weights(df['total_weight']).where(
+        df['total_weight'].notna() & (df['total_weight'] != '')
+    )
+    invoice_date = excel_dates_to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+
+    updates = pd.DataFrame({
+        'weight_lbs': weight_lbs,
+        'total_weight_lbs': total_weight_lbs,
+        'invoice_date': invoice_date,
+        'id': df['id'],
+    }).astype(object).where(lambda frame: frame.notna(), None)
+    cursor.executemany(
+        'UPDATE invoices SET weight_lbs = ?, total_weight_lbs = ?, invoice_date = ? WHERE id = ?',
+        updates.itertuples(index=False, name=None)
+    )
+
+# Rebuild the daily rollup read by INVOICE_QUERY_MODE=sqlite: every day when the
+# table is new, otherwise the days of the backfilled rows
+has_rollup = cursor.execute(
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoice_daily_rollup'"
+).fetchone() is not None
+if has_rollup:
+    days = invoice_date.dropna().unique() if not df.empty else []
+else:
+    days = [row[0] for row in cursor.execute('SELECT DISTINCT invoice_date FROM invoices')]
+refresh_sqlite_rollup(conn, days, commit=False)
+
+cursor.execute('PRAGMA user_version = 2')
 
 # Commit changes and close the connection
 conn.commit()
 conn.close()
 
-print("Database schema updated successfully.")
+print(f"Database schema updated successfully ({len(df)} rows backfilled, {len(days)} rollup days rebuilt).")